@@ -0,0 +1,106 @@
+from json import dump, load
+import os
+import threading
+from time import time
+
+from utils import select_query, print_msg
+
+ABBREVIATIONS_CACHE_PATH = os.environ.get(
+    'ABBREVIATIONS_CACHE_PATH', '/tmp/tag_translations.json'
+)
+# Upper bound on the age of the cache, and the only check when the tables
+# report no UPDATE_TIME, which InnoDB does after a restart or when the
+# statistics are not persisted.
+ABBREVIATIONS_TTL_SECONDS = float(
+    os.environ.get('ABBREVIATIONS_TTL_SECONDS', 24 * 60 * 60)
+)
+ABBREVIATIONS_SOURCE_TABLES = tuple(
+    os.environ.get('ABBREVIATIONS_SOURCE_TABLES', 'teams,leagues').split(',')
+)
+
+__cached = None
+__cached_lock = threading.Lock()
+
+
+def get_tag_translations(cursor):
+    """Teams and leagues abbreviations merged into one tag -> tag dict.
+
+    Kept in process and in ABBREVIATIONS_CACHE_PATH, and reloaded when the
+    source tables change or the cache is older than the TTL.
+    """
+    global __cached
+    # Brings the whole generation package, only needed on a reload.
+    from generate_industrial.tables import (
+        get_teams_abbreviations_dict, get_leagues_abbreviations_dict
+    )
+    version = get_abbreviations_version(cursor)
+    with __cached_lock:
+        cached = __cached
+    if cached is None:
+        cached = __load_cached()
+    if cached is None or not __is_fresh(cached, version):
+        translations = merge_translations(
+            get_teams_abbreviations_dict(cursor),
+            get_leagues_abbreviations_dict(cursor)
+        )
+        print_msg(f'Loaded {len(translations)} tag translations.')
+        cached = {
+            'version': version, 'loaded_at': time(),
+            'translations': translations
+        }
+        __store_cached(cached)
+    with __cached_lock:
+        __cached = cached
+    return cached['translations']
+
+
+def get_abbreviations_version(cursor):
+    # MySQL 8 caches the information_schema statistics, UPDATE_TIME
+    # included, for a day by default.
+    cursor.execute('SET SESSION information_schema_stats_expiry = 0')
+    (update_time,), = select_query(
+        cursor, 'MAX(UPDATE_TIME)', 'tables',
+        'table_schema = %s AND table_name IN '
+        f'({", ".join(["%s"] * len(ABBREVIATIONS_SOURCE_TABLES))})',
+        'information_schema',
+        ('superleague',) + ABBREVIATIONS_SOURCE_TABLES
+    )
+    return None if update_time is None else str(update_time)
+
+
+def merge_translations(teams_abbreviations, leagues_abbreviations):
+    # Teams are translated first and the result goes through the leagues
+    # map, so a single lookup has to give what the two used to.
+    translations = dict(leagues_abbreviations)
+    for abbreviation, name in teams_abbreviations.items():
+        translations[abbreviation] = leagues_abbreviations.get(name, name)
+    return translations
+
+
+def clear_tag_translations():
+    global __cached
+    with __cached_lock:
+        __cached = None
+    if os.path.exists(ABBREVIATIONS_CACHE_PATH):
+        os.remove(ABBREVIATIONS_CACHE_PATH)
+
+
+def __is_fresh(cached, version):
+    if time() - cached['loaded_at'] >= ABBREVIATIONS_TTL_SECONDS:
+        return False
+    return version is None or cached['version'] == version
+
+
+def __load_cached():
+    try:
+        with open(ABBREVIATIONS_CACHE_PATH, encoding='utf8') as f:
+            return load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def __store_cached(cached):
+    tmp_path = f'{ABBREVIATIONS_CACHE_PATH}.tmp'
+    with open(tmp_path, 'w', encoding='utf8') as f:
+        dump(cached, f, ensure_ascii=False)
+    os.replace(tmp_path, ABBREVIATIONS_CACHE_PATH)
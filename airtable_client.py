@@ -0,0 +1,169 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import os
+import random
+import threading
+from time import monotonic, sleep
+
+import requests
+
+from instrumentation import count
+from utils import split_into_chunks
+
+AIRTABLE_API_KEY = os.environ.get('AIRTABLE_API_KEY')
+AIRTABLE_API_URL = os.environ.get(
+    'AIRTABLE_API_URL', 'https://api.airtable.com/v0'
+)
+AIRTABLE_BATCH_SIZE = 10
+AIRTABLE_REQUESTS_PER_SECOND = 5
+AIRTABLE_UPLOAD_WORKERS = int(os.environ.get('AIRTABLE_UPLOAD_WORKERS', 4))
+AIRTABLE_MAX_RETRIES = 6
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_CAP_SECONDS = 30
+
+UploadResult = namedtuple('UploadResult', ('created', 'failed'))
+
+
+class TokenBucket:
+    """Thread-safe token bucket; `acquire` blocks until a token is free."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self.tokens = self.capacity
+        self.updated_at = monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+
+
+# AirTable limits requests per base, so every upload to the same base in
+# this process shares one bucket.
+__limiters = {}
+__limiters_lock = threading.Lock()
+__sessions = threading.local()
+
+
+def get_base_limiter(base_id):
+    with __limiters_lock:
+        if base_id not in __limiters:
+            __limiters[base_id] = TokenBucket(AIRTABLE_REQUESTS_PER_SECOND, 1)
+        return __limiters[base_id]
+
+
+def create_records(
+        base_id, table_id, records, api_key,
+        workers=AIRTABLE_UPLOAD_WORKERS, api_url=AIRTABLE_API_URL
+):
+    url = f'{api_url}/{base_id}/{table_id}'
+    limiter = get_base_limiter(base_id)
+    batches = list(split_into_chunks(records, AIRTABLE_BATCH_SIZE))
+    with ThreadPoolExecutor(max(1, workers)) as executor:
+        results = list(executor.map(
+            lambda batch: __create_batch(url, batch, api_key, limiter),
+            batches
+        ))
+    created = [r for single_result in results for r in single_result.created]
+    failed = [r for single_result in results for r in single_result.failed]
+    return UploadResult(created, failed)
+
+
+def iterate_records(
+        base_id, table_id, api_key, filter_by_formula=None,
+        api_url=AIRTABLE_API_URL
+):
+    url = f'{api_url}/{base_id}/{table_id}'
+    limiter = get_base_limiter(base_id)
+    params = {'pageSize': 100}
+    if filter_by_formula is not None:
+        params['filterByFormula'] = filter_by_formula
+    while True:
+        response = __request_with_backoff(
+            'GET', url, api_key, limiter, params=params
+        )
+        if response is None or response.status_code != 200:
+            status = None if response is None else response.status_code
+            raise requests.HTTPError(f'GET {url} failed with {status}')
+        page = response.json()
+        yield from page['records']
+        if 'offset' not in page:
+            break
+        params['offset'] = page['offset']
+
+
+def __create_batch(url, batch, api_key, limiter):
+    payload = {'records': [{'fields': fields} for fields in batch]}
+    response = __request_with_backoff('POST', url, api_key, limiter, payload)
+    if response is not None and response.status_code == 200:
+        return UploadResult(response.json()['records'], [])
+    if response is not None and len(batch) > 1 and (
+            response.status_code == 422
+    ):
+        # One invalid record rejects the whole batch, so isolate it.
+        results = [
+            __create_batch(url, [fields], api_key, limiter)
+            for fields in batch
+        ]
+        return UploadResult(
+            [r for single_result in results for r in single_result.created],
+            [r for single_result in results for r in single_result.failed],
+        )
+    return UploadResult([], list(batch))
+
+
+def __request_with_backoff(
+        method, url, api_key, limiter, payload=None, params=None
+):
+    headers = {'Authorization': f'Bearer {api_key}'}
+    response = None
+    for attempt in range(AIRTABLE_MAX_RETRIES + 1):
+        limiter.acquire()
+        count('http_calls')
+        if attempt > 0:
+            count('http_retries')
+        try:
+            response = __get_session().request(
+                method, url, json=payload, params=params, headers=headers,
+                timeout=30
+            )
+        except requests.RequestException:
+            response = None
+        else:
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                return response
+        if attempt < AIRTABLE_MAX_RETRIES:
+            sleep(__backoff_delay(attempt, response))
+    return response
+
+
+def __backoff_delay(attempt, response):
+    retry_after = None
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    delay = min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+    return random.uniform(0, delay)
+
+
+def __get_session():
+    if not hasattr(__sessions, 'session'):
+        __sessions.session = requests.Session()
+    return __sessions.session
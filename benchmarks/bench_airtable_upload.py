@@ -0,0 +1,81 @@
+"""Cards/sec of the AirTable upload path, one-by-one vs batched.
+
+Runs against a local fake AirTable server that enforces the 5 req/s
+per-base limit:
+
+    python -m benchmarks.bench_airtable_upload --cards 200 --latency 0.2
+"""
+import argparse
+from time import perf_counter
+
+from airtable import airtable, AirtableError
+
+from airtable_client import create_records
+from benchmarks.stand_ins import FakeAirtableServer
+from utils import print_msg
+
+BASE_ID = 'appBenchmark'
+TABLE_ID = 'tblQuestions'
+
+
+def make_cards(count):
+    return [
+        {
+            'Card': f'Did player {i} play for team {i % 50}?',
+            'Tags': [f'rec{i % 300:014d}'],
+            'Parent-tag': ['recParent'],
+            'Tier': 'Medium',
+            'Answer': 'TRUE' if i % 2 == 0 else 'FALSE',
+        }
+        for i in range(count)
+    ]
+
+
+def run_one_by_one(fake, cards):
+    airtable_cursor = airtable.Airtable(BASE_ID, 'key')
+    airtable_cursor.base_url = f'{fake.api_url}/{BASE_ID}'
+    sent_count = 0
+    start = perf_counter()
+    for single_card in cards:
+        for _ in range(10):
+            try:
+                airtable_cursor.create(TABLE_ID, single_card)
+                sent_count += 1
+                break
+            except AirtableError:
+                continue
+    return perf_counter() - start, sent_count
+
+
+def run_batched(fake, cards, workers):
+    start = perf_counter()
+    result = create_records(
+        BASE_ID, TABLE_ID, cards, 'key', workers, fake.api_url
+    )
+    return perf_counter() - start, len(result.created)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cards', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    cards = make_cards(args.cards)
+    with FakeAirtableServer(latency=args.latency) as fake:
+        one_by_one, one_by_one_sent = run_one_by_one(fake, cards)
+    with FakeAirtableServer(latency=args.latency) as fake:
+        batched, batched_sent = run_batched(fake, cards, args.workers)
+    print_msg(
+        f'one-by-one: {len(cards) / one_by_one:,.1f} cards/sec, '
+        f'sent {one_by_one_sent}/{len(cards)}'
+    )
+    print_msg(
+        f'batched:    {len(cards) / batched:,.1f} cards/sec, '
+        f'sent {batched_sent}/{len(cards)}'
+    )
+    print_msg(f'speedup: {one_by_one / batched:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Cold-start import time of the Lambda entry point, checked against a budget.
+
+Imports the module in a fresh interpreter under `python -X importtime`:
+
+    python -m benchmarks.bench_import_time --budget-ms 150
+
+The exit code is 1 when the median import time is over the budget or when
+one of the `--forbid` modules is imported. Those are only needed once a
+pool runs short and are loaded on demand by `question_pool`.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+from utils import print_msg
+
+FORBIDDEN_MODULES = (
+    'numpy', 'tqdm', 'generate_industrial', 'run_industrial_generation',
+    'generation_planner', 'team_snapshot'
+)
+
+
+def measure_imports(module):
+    out = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ).stderr
+    imports = {}
+    for single_line in out.splitlines():
+        if not single_line.startswith('import time:') or '[us]' in single_line:
+            continue
+        _, cumulative, name = single_line.split('|')
+        imports[name.strip()] = int(cumulative) / 1000
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='lambda_function')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=150)
+    parser.add_argument('--forbid', nargs='*', default=FORBIDDEN_MODULES)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+    runs = [measure_imports(args.module) for _ in range(args.runs)]
+    elapsed = sorted(single_run[args.module] for single_run in runs)
+    median = elapsed[len(elapsed) // 2]
+    print_msg(f'import {args.module}: {median:.1f} ms (median of {args.runs})')
+    imports = runs[len(runs) // 2]
+    heaviest = sorted(
+        (item for item in imports.items() if item[0] != args.module),
+        key=lambda item: -item[1]
+    )
+    for name, cumulative in heaviest[:args.top]:
+        print_msg(f'{cumulative:8.1f} ms  {name}')
+    failed = False
+    forbidden = sorted(
+        {name.split('.')[0] for name in imports} & set(args.forbid)
+    )
+    if len(forbidden) > 0:
+        print_msg(f'Imported on cold start: {", ".join(forbidden)}')
+        failed = True
+    if median > args.budget_ms:
+        print_msg(f'Over the {args.budget_ms:.0f} ms budget.')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
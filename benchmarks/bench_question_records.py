@@ -0,0 +1,107 @@
+"""Memory and CPU of the question representation, old vs new.
+
+The old pipeline keeps questions as a dict of dicts, stringifies tags
+with f-strings and parses them back with `ast.literal_eval` before the
+upload; the new one keeps `Question` records and JSON-encodes tags only
+for the DB row:
+
+    python -m benchmarks.bench_question_records --sizes 4000 40000
+"""
+import argparse
+import ast
+from time import perf_counter
+import tracemalloc
+
+from questions import Question
+from utils import merge_dicts, print_msg
+
+GENERATORS_COUNT = 27
+
+
+def make_generator_outputs(size, as_records):
+    outputs = []
+    per_generator = size // GENERATORS_COUNT + 1
+    for g in range(GENERATORS_COUNT):
+        output = {}
+        for i in range(per_generator):
+            text = f'Generator {g} question {i}: did player {i} score?'
+            tags = [f'rec{i % 300:014d}', f'rec{g:014d}']
+            if as_records:
+                output[text] = Question(
+                    text, tags, ['recParent'], 'medium',
+                    'Did $PLAYER score for $TEAM?', i % 2 == 0
+                )
+            else:
+                output[text] = {
+                    'tags': tags,
+                    'parent_tags': ['recParent'],
+                    'difficulty': 'medium',
+                    'template': 'Did $PLAYER score for $TEAM?',
+                    'answer': i % 2 == 0,
+                }
+        outputs.append(output)
+    return outputs
+
+
+def run_dicts(size):
+    questions = {}
+    for output in make_generator_outputs(size, False):
+        questions = merge_dicts(questions, output)
+    rows = [
+        (
+            q, f'{v["tags"]}', f'{v["parent_tags"]}', v['difficulty'],
+            v['template'], int(v['answer'])
+        )
+        for q, v in questions.items()
+    ]
+    return [
+        {
+            'Card': q, 'Tags': ast.literal_eval(tags),
+            'Parent-tag': ast.literal_eval(parent_tags),
+            'Tier': d.capitalize(), 'Answer': 'TRUE' if a else 'FALSE',
+        }
+        for q, tags, parent_tags, d, _, a in rows
+    ]
+
+
+def run_records(size):
+    questions = {}
+    for output in make_generator_outputs(size, True):
+        questions = merge_dicts(questions, output)
+    questions = list(questions.values())
+    rows = [q.to_row() for q in questions]
+    return rows, [
+        {
+            'Card': q.text, 'Tags': q.tags, 'Parent-tag': q.parent_tags,
+            'Tier': q.difficulty.capitalize(),
+            'Answer': 'TRUE' if q.answer else 'FALSE',
+        }
+        for q in questions
+    ]
+
+
+def measure(function, size):
+    tracemalloc.start()
+    start = perf_counter()
+    function(size)
+    elapsed = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[4000, 40000])
+    args = parser.parse_args()
+    for size in args.sizes:
+        for name, function in (('dicts', run_dicts), ('records', run_records)):
+            elapsed, peak = measure(function, size)
+            print_msg(
+                f'{size:>6} questions, {name:<7}: {elapsed * 1000:8.1f} ms, '
+                f'peak {peak / 2 ** 20:6.1f} MiB'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Rows/sec of the templates DB insert path, per-row vs bulk.
+
+Runs against an in-memory SQLite stand-in for `templates.templates`:
+
+    python -m benchmarks.bench_rds_insert --rows 12000 --chunk-size 1000
+"""
+import argparse
+from datetime import datetime
+from time import perf_counter
+
+from benchmarks.stand_ins import setup_templates_sqlite
+from question_pool import TEMPLATES_COLUMNS
+from utils import (
+    insert_into_query, bulk_insert_into_query, question_hash, print_msg
+)
+
+
+def make_rows(count):
+    timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    return [
+        (
+            f'Did player {i} play for team {i % 50}?',
+            f'{["rec" + str(i % 300), "rec" + str(i % 70)]}',
+            '["recParent"]',
+            'medium',
+            'Did $PLAYER play for $TEAM?',
+            i % 2,
+            timestamp,
+            int(i % 3 == 0),
+            question_hash(f'Did player {i} play for team {i % 50}?'),
+        )
+        for i in range(count)
+    ]
+
+
+def run_per_row(rows):
+    connection, cursor = setup_templates_sqlite()
+    start = perf_counter()
+    for single_row in rows:
+        insert_into_query(
+            cursor, 'templates', TEMPLATES_COLUMNS, single_row, 'templates'
+        )
+    connection.commit()
+    elapsed = perf_counter() - start
+    connection.close()
+    return elapsed
+
+
+def run_bulk(rows, chunk_size):
+    connection, cursor = setup_templates_sqlite()
+    start = perf_counter()
+    bulk_insert_into_query(
+        cursor, 'templates', TEMPLATES_COLUMNS, rows, 'templates', chunk_size
+    )
+    connection.commit()
+    elapsed = perf_counter() - start
+    connection.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=12000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+    rows = make_rows(args.rows)
+    per_row = run_per_row(rows)
+    bulk = run_bulk(rows, args.chunk_size)
+    print_msg(f'per-row insert: {len(rows) / per_row:,.0f} rows/sec')
+    print_msg(f'bulk insert:    {len(rows) / bulk:,.0f} rows/sec')
+    print_msg(f'speedup: {per_row / bulk:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Per-call cost of the text normalization helpers, before and after memoizing.
+
+Names are drawn from a Zipf-like distribution over a fixed vocabulary, the
+way a batch of questions keeps mentioning the same popular players, teams
+and leagues:
+
+    python -m benchmarks.bench_text_normalization --calls 200000
+"""
+import argparse
+from datetime import date
+import random
+import re
+from time import perf_counter
+from unicodedata import normalize
+
+from constants import VOWELS
+from text_normalization import (
+    clear_normalization_caches, format_player_tag, is_league_with_article,
+    is_vowel_start, preprocess_player_name, preprocess_tag
+)
+from utils import print_msg
+
+FIRST_NAMES = (
+    'Antoine', 'Koke', 'Jan', 'Ángel', 'Saúl', 'Diego', 'Álvaro', 'Thomas',
+    'Rodrigo', 'João', 'Yannick', 'Marcos', 'Stefan', 'José', 'Óliver',
+    'Nahuel', 'Memphis', 'Axel', 'Çağlar', 'Reinildo', 'Samuel', 'Gabriel',
+)
+LAST_NAMES = (
+    'Griezmann', 'Oblak', 'Correa', 'Ñíguez', 'Simeone', 'Morata', 'Lemar',
+    'De Paul', 'Félix', 'Carrasco', 'Llorente', 'Savić', 'Giménez',
+    'Molina', 'Depay', 'Witsel', 'Söyüncü', 'Lino', 'DANGELO', 'MCDONALD',
+)
+LEAGUES = (
+    'La Liga', 'Premier League', 'Serie A', 'Bundesliga', 'Ligue 1',
+    'Eredivisie', 'Liga Portugal', 'Le Championnat', 'Süper Lig',
+)
+TEAMS = (
+    'Atlético Madrid', 'Real Madrid', 'Barcelona', 'Sevilla', 'Valencia',
+    'Athletic Club', 'Inter', 'Olympique Lyonnais', 'Ajax', 'Benfica',
+)
+
+
+def legacy_preprocess_tag(tag):
+    tag = tag.lower()
+    tag = tag.strip()
+    tag = normalize('NFKD', tag).encode('ascii', 'ignore').decode('ascii')
+    return tag
+
+
+def legacy_preprocess_player_name(player_name):
+    no_ap = re.findall(r'[A-Z]{2}', player_name)
+    for single_no_ap in no_ap:
+        if len(single_no_ap) != 2:
+            continue
+        first_ch, second_ch = single_no_ap
+        player_name = player_name.replace(
+            single_no_ap, f'{first_ch}\'{second_ch}'
+        )
+    return player_name
+
+
+def legacy_format_player_tag(name, birth_date):
+    if birth_date is None:
+        return name
+    return f'{name}_{birth_date.strftime("%d.%m.%Y")}'
+
+
+def legacy_is_vowel_start(s):
+    return any(s.lower().startswith(v) for v in VOWELS)
+
+
+def legacy_is_league_with_article(league):
+    articles = ('la', 'le',)
+    return any(a in league.lower().split(' ') for a in articles)
+
+
+def make_players(count, rng):
+    return [
+        (
+            f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            date(rng.randint(1975, 2005), rng.randint(1, 12),
+                 rng.randint(1, 28))
+        )
+        for _ in range(count)
+    ]
+
+
+def zipf_sample(items, count, rng, exponent=1.1):
+    weights = [1 / (rank + 1) ** exponent for rank in range(len(items))]
+    return rng.choices(items, weights, k=count)
+
+
+def make_cases(calls, players_count, seed=0):
+    rng = random.Random(seed)
+    players = zipf_sample(make_players(players_count, rng), calls, rng)
+    names = [name for name, _ in players]
+    tags = zipf_sample(
+        [f' {name} ' for name, _ in players[:players_count]]
+        + list(LEAGUES) + list(TEAMS), calls, rng
+    )
+    leagues = zipf_sample(list(LEAGUES), calls, rng)
+    teams = zipf_sample(list(TEAMS) + list(LEAGUES), calls, rng)
+    return (
+        ('preprocess_tag', legacy_preprocess_tag, preprocess_tag,
+         [(t,) for t in tags]),
+        ('preprocess_player_name', legacy_preprocess_player_name,
+         preprocess_player_name, [(n,) for n in names]),
+        ('format_player_tag', legacy_format_player_tag, format_player_tag,
+         players),
+        ('is_vowel_start', legacy_is_vowel_start, is_vowel_start,
+         [(t,) for t in teams]),
+        ('is_league_with_article', legacy_is_league_with_article,
+         is_league_with_article, [(league,) for league in leagues]),
+    )
+
+
+def time_calls(function, arguments):
+    start = perf_counter()
+    results = [function(*single_arguments) for single_arguments in arguments]
+    return perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--players', type=int, default=5000)
+    args = parser.parse_args()
+    clear_normalization_caches()
+    for name, legacy, memoized, arguments in make_cases(
+            args.calls, args.players
+    ):
+        legacy_elapsed, expected = time_calls(legacy, arguments)
+        elapsed, results = time_calls(memoized, arguments)
+        if results != expected:
+            raise AssertionError(f'{name} results differ from the legacy ones')
+        print_msg(
+            f'{name:<24} {legacy_elapsed / len(arguments) * 1e9:7.0f} ns -> '
+            f'{elapsed / len(arguments) * 1e9:5.0f} ns per call '
+            f'({legacy_elapsed / elapsed:.1f}x, '
+            f'{len(set(arguments))} distinct inputs)'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Synthetic superleague and templates data at configurable scale."""
+from datetime import date
+import random
+
+from benchmarks.stand_ins import setup_templates_sqlite
+from question_pool import TEMPLATES_COLUMNS
+from questions import Question
+from utils import bulk_insert_into_query, question_hash
+
+POSITIONS = (
+    'Centre-Back', 'Right-Back', 'Left-Back', 'Defensive Midfield',
+    'Central Midfield', 'Attacking Midfield', 'Centre-Forward',
+    'Left Winger', 'Right Winger', 'Goalkeeper',
+)
+TEMPLATES = (
+    'Did $PLAYER play for $TEAM?',
+    'Did $PLAYER play for $TEAM as $POSITION?',
+    'Did $PLAYER play for $TEAM in $LEAGUE in $SEASON?',
+    'Did $PLAYER move from $FROMTEAM to $TOTEAM?',
+    'Did $WINNER beat $NOWINNER in the $LEAGUE final in $SEASON?',
+    'Did $PLAYER score more than $SNUMBER goals for $TEAM in $SEASON?',
+)
+PLAYERS_COLUMNS = ('player_id', 'name', 'birth_date', 'position')
+MATCHES_COLUMNS = (
+    'season', 'home_team_id', 'away_team_id', 'stadium', 'attendance'
+)
+
+
+class SuperleagueFixture:
+    """In-memory superleague data: plain row lists per table."""
+
+    def __init__(
+            self, teams=20, players_per_team=60, seasons=30,
+            matches_per_season=380, seed=0
+    ):
+        rng = random.Random(seed)
+        self.teams = [
+            (team_id, f'Team {team_id} FC', f'T{team_id}')
+            for team_id in range(1, teams + 1)
+        ]
+        self.leagues = [(1, 'La Liga', 'LL'), (2, 'Premier League', 'PL')]
+        self.seasons = [
+            (season_id, 1 + season_id % 2, f'{1992 + s}-{1993 + s}')
+            for season_id, s in enumerate(range(seasons), start=1)
+        ]
+        # Every 40th player has no birth date and every 10th match no
+        # attendance, like the NULLs of the real tables.
+        self.players = [
+            (
+                player_id, f'Player {player_id} DE LA {player_id % 7}',
+                None if player_id % 40 == 0 else
+                date(1970 + player_id % 35, 1 + player_id % 12, 1),
+                rng.choice(POSITIONS)
+            )
+            for player_id in range(1, teams * players_per_team + 1)
+        ]
+        self.assignment = [
+            (player_id, rng.randint(1, teams))
+            for player_id, _, _, _ in self.players
+            for _ in range(rng.randint(1, 3))
+        ]
+        self.matches = [
+            (
+                season_id, rng.randint(1, teams), rng.randint(1, teams),
+                f'Stadium {rng.randint(1, teams)}',
+                None if i % 10 == 0 else 20000 + 100 * i % 60000
+            )
+            for season_id, _, _ in self.seasons
+            for i in range(matches_per_season)
+        ]
+
+    def team_players(self, team_id):
+        """Players of a team in the (column_names, rows) loader form."""
+        player_ids = {p for p, t in self.assignment if t == team_id}
+        return PLAYERS_COLUMNS, [
+            single_player for single_player in self.players
+            if single_player[0] in player_ids
+        ]
+
+    def team_matches(self, team_id):
+        seasons = {season_id: name for season_id, _, name in self.seasons}
+        return MATCHES_COLUMNS, [
+            (seasons[season_id], home, away, stadium, attendance)
+            for season_id, home, away, stadium, attendance in self.matches
+            if home == team_id or away == team_id
+        ]
+
+    def teams_abbreviations(self):
+        return {abbreviation: name for _, name, abbreviation in self.teams}
+
+    def leagues_abbreviations(self):
+        return {abbreviation: name for _, name, abbreviation in self.leagues}
+
+
+def make_questions(count, offset=0, parent_tag='recParent'):
+    return [
+        Question(
+            f'Synthetic question {offset + i}: did player {i % 997} play '
+            f'for team {i % 20}?',
+            [f'rec{i % 300:014d}', f'rec{i % 20:014d}'], [parent_tag],
+            ('easy', 'medium', 'hard')[i % 3], TEMPLATES[i % len(TEMPLATES)],
+            i % 2 == 0, '2023-01-01 00:00:00', False
+        )
+        for i in range(count)
+    ]
+
+
+def build_templates_db(rows, parent_tag='recParent'):
+    connection, cursor = setup_templates_sqlite()
+    questions = make_questions(rows, parent_tag=parent_tag)
+    bulk_insert_into_query(
+        cursor, 'templates', TEMPLATES_COLUMNS,
+        [q.to_row() + (question_hash(q.text),) for q in questions],
+        'templates'
+    )
+    bulk_insert_into_query(
+        cursor, 'question_parent_tags', ('parent_tag', 'question_hash'),
+        [(parent_tag, question_hash(q.text)) for q in questions],
+        'templates'
+    )
+    connection.commit()
+    return connection, cursor
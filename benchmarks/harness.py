@@ -0,0 +1,445 @@
+"""Offline benchmark suite for the generation and lambda pipeline stages.
+
+Builds synthetic superleague and templates data, runs the stages against
+an in-memory SQLite stand-in for the templates DB and a local fake
+AirTable, and compares the results with a stored baseline:
+
+    python -m benchmarks.harness --sizes 1000 10000 100000
+    python -m benchmarks.harness --save-baseline
+
+The exit code is 1 when a stage is slower than its baseline by more than
+`--threshold` (and by more than `--min-delta-ms`).
+
+The generators in `generate_industrial` need a live superleague, so
+`run_industrial_generation` and `lambda_handler` run with synthetic
+generators in their place, which do the same per-question work through the
+`utils` helpers. Team snapshots are built by `team_snapshot` from loaders
+that read the fixture. Neither `generate_industrial` nor the `db` package
+is needed: the harness installs its own connection factories.
+"""
+import argparse
+from collections import Counter
+from datetime import timedelta
+from functools import partial
+import importlib.util
+from json import dump, dumps, load
+import os
+import tempfile
+from time import perf_counter, sleep
+
+from benchmarks.fixtures import (
+    SuperleagueFixture, TEMPLATES, build_templates_db, make_questions
+)
+from benchmarks.stand_ins import (
+    FakeAirtableServer, connect_sqlite, setup_templates_sqlite
+)
+import connections
+import instrumentation
+import lambda_function
+import question_pool
+import run_industrial_generation
+import tag_index
+import team_snapshot
+from abbreviations import merge_translations
+from airtable_client import create_records
+from instrumentation import get_metrics, reset_metrics
+from utils import (
+    AssignmentIndex, append_question, assess_difficulties, choose_random_templates,
+    cut_off_mask, generate_random_player_team_couples,
+    make_questions_from_positive_and_negative, print_msg, resolve_counts,
+    season_first_years, shorten_season
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+UPLOAD_CARDS = 200
+NEW_TAGS = 50
+EXISTING_TAGS_CAP = 2000
+
+
+def synthetic_player_played_in_team(
+        team_id, cut_off_left, cut_off_right, count, snapshot
+):
+    positive_count, negative_count = resolve_counts(count)
+    positive, negative = {}, {}
+    couples = generate_random_player_team_couples(
+        team_id, positive_count, snapshot.assignment
+    )
+    templates = choose_random_templates(list(TEMPLATES[:2]), len(couples))
+    for (player_id, _), template in zip(couples, templates):
+        append_question(
+            positive, f'Did player {player_id} play for team {team_id}?',
+            [f'Player {player_id}', f'T{team_id}'], [], 'easy', template
+        )
+    other_team_id = team_id % len(snapshot.teams) + 1
+    couples = generate_random_player_team_couples(
+        other_team_id, negative_count, snapshot.assignment
+    )
+    for player_id, _ in couples:
+        append_question(
+            negative, f'Did player {player_id} play for team {team_id}? ',
+            [f'Player {player_id}', f'T{team_id}'], [], 'easy', TEMPLATES[0]
+        )
+    return make_questions_from_positive_and_negative(positive, negative)
+
+
+def synthetic_team_vs_team_at_season(
+        team_id, cut_off_left, cut_off_right, count, snapshot
+):
+    matches = snapshot.matches
+    # Season names repeat, so their first years are parsed once per
+    # distinct name and spread over the rows through the codes.
+    first_years = season_first_years(
+        matches.vocabularies['season']
+    )[matches.columns['season']]
+    keep = cut_off_mask(
+        first_years, cut_off_left.get(team_id, cut_off_left['default']),
+        cut_off_right.get(team_id, cut_off_right['default'])
+    ).nonzero()[0][:count]
+    seasons = matches.values('season')[keep].tolist()
+    template = TEMPLATES[2]
+    difficulties = assess_difficulties([template] * len(keep), seasons)
+    questions = {}
+    for season, home, away, stadium, difficulty in zip(
+            seasons, matches.columns['home_team_id'][keep].tolist(),
+            matches.columns['away_team_id'][keep].tolist(),
+            matches.values('stadium')[keep].tolist(), difficulties
+    ):
+        append_question(
+            questions,
+            f'Did team {home} play team {away} at {stadium} in '
+            f'{shorten_season(season)}?',
+            [f'T{home}', f'T{away}', 'LL'], [], difficulty, template
+        )
+    return make_questions_from_positive_and_negative(questions, {})
+
+
+SYNTHETIC_GENERATORS = (
+    synthetic_player_played_in_team,
+    synthetic_team_vs_team_at_season,
+)
+
+
+def install_synthetic_generators():
+    run_industrial_generation.QUESTION_GENERATORS = SYNTHETIC_GENERATORS
+    run_industrial_generation.GENERATORS_RATIOS = {
+        single_generator.__name__: 1 / len(SYNTHETIC_GENERATORS)
+        for single_generator in SYNTHETIC_GENERATORS
+    }
+
+
+def run_generators(fixture, size):
+    """Times run_industrial_generation with the synthetic generators."""
+    counts = {
+        single_generator.__name__: size // len(fixture.teams)
+        for single_generator in SYNTHETIC_GENERATORS
+    }
+    team_snapshot.clear_snapshot_cache()
+    reset_metrics()
+    produced = Counter()
+    start = perf_counter()
+    for team_id, _, _ in fixture.teams:
+        produced.update(
+            single_question.generator
+            for single_question in run_industrial_generation
+            .run_industrial_generation(
+                team_id, 0, workers=1, seed=0, counts=counts
+            )
+        )
+    results = {
+        'run_industrial_generation': __result(
+            perf_counter() - start, sum(produced.values())
+        ),
+    }
+    stages, _ = get_metrics()
+    for name in counts:
+        results[f'generator.{name}'] = __result(
+            stages.get(f'generator.{name}', 0), produced[name]
+        )
+    connections.close_all_connections()
+    return results
+
+
+def install_fixture_snapshot_loaders(fixture):
+    """Loads the team snapshots from the fixture instead of superleague."""
+    connections.CONNECTION_FACTORIES['superleague'] = (
+        connect_sqlite, lambda connection, _: connection.close()
+    )
+    translations = merge_translations(
+        fixture.teams_abbreviations(), fixture.leagues_abbreviations()
+    )
+    team_snapshot.SHARED_LOADERS['tag_translations'] = (
+        lambda cursor: translations
+    )
+    team_snapshot.SHARED_LOADERS['teams'] = (
+        lambda cursor: (('team_id', 'name', 'abbreviation'), fixture.teams)
+    )
+    team_snapshot.SHARED_LOADERS['assignment'] = (
+        lambda cursor: AssignmentIndex(fixture.assignment)
+    )
+    team_snapshot.SNAPSHOT_LOADERS['players'] = (
+        lambda cursor, team_id, *_: fixture.team_players(team_id)
+    )
+    team_snapshot.SNAPSHOT_LOADERS['matches'] = (
+        lambda cursor, team_id, *_: fixture.team_matches(team_id)
+    )
+    team_snapshot.clear_snapshot_cache()
+
+
+def run_snapshot_stages(fixture):
+    results = {}
+    team_snapshot.clear_snapshot_cache()
+    start = perf_counter()
+    rows = 0
+    for team_id, _, _ in fixture.teams:
+        snapshot = team_snapshot.load_team_snapshot(team_id, 1990, 2022)
+        rows += len(snapshot.players) + len(snapshot.matches)
+    results['team_snapshot'] = __result(perf_counter() - start, rows)
+    connections.close_all_connections()
+    return results
+
+
+def run_templates_stages(size):
+    connection, cursor = build_templates_db(size)
+    connections.CONNECTION_FACTORIES['templates'] = (
+        lambda: (connection, cursor), lambda *_: None
+    )
+    connections.close_all_connections()
+    results = {}
+    candidates = make_questions(size // 2, offset=size // 2)
+    start = perf_counter()
+    unique = question_pool.exclude_duplicates(candidates)
+    results['exclude_duplicates'] = __result(
+        perf_counter() - start, len(candidates)
+    )
+    start = perf_counter()
+    question_pool.add_new_questions_to_rds('recParent', [], unique)
+    results['rds_insert'] = __result(perf_counter() - start, len(unique))
+    start = perf_counter()
+    claim_id = question_pool.new_claim_id()
+    pool = question_pool.claim_not_used_questions(
+        claim_id, 'recParent', size // 10
+    )
+    results['select_unused'] = __result(perf_counter() - start, len(pool))
+    start = perf_counter()
+    question_pool.mark_claimed_questions_as_used(claim_id)
+    results['mark_used'] = __result(perf_counter() - start, len(pool))
+    connections.close_all_connections()
+    connection.close()
+    return results
+
+
+def run_handler_stages(size):
+    """Times the lambda_handler stages, half of the cards from the pool."""
+    cards = min(size, UPLOAD_CARDS)
+    connection, cursor = build_templates_db(cards // 2)
+    connections.CONNECTION_FACTORIES['templates'] = (
+        lambda: (connection, cursor), lambda *_: None
+    )
+    connections.close_all_connections()
+    tag_index.clear_tag_indices()
+    event = {'body': dumps({
+        'parentTagRecordId': 'recParent', 'parentTagTeamId': 1,
+        'cardsRequired': cards, 'baseId': 'appBenchmark',
+        'tableId': 'tblQuestions', 'tagsTableId': 'tblTags',
+    })}
+    original = lambda_function.create_records, tag_index.resolve_tags
+    with FakeAirtableServer(latency=0.05) as fake:
+        # Both read the AirTable URL from a default bound at import time.
+        lambda_function.create_records = partial(
+            original[0], api_url=fake.api_url
+        )
+        tag_index.resolve_tags = partial(original[1], api_url=fake.api_url)
+        reset_metrics()
+        try:
+            lambda_function.lambda_handler(event, None)
+        finally:
+            lambda_function.create_records, tag_index.resolve_tags = original
+    stages, _ = get_metrics()
+    connections.close_all_connections()
+    connection.close()
+    return {
+        f'handler.{name}': __result(seconds, cards)
+        for name, seconds in stages.items()
+        if not name.startswith('generator.')
+    }
+
+
+def check_tag_index_across_containers():
+    """Two containers sharing the templates DB must not duplicate a tag.
+
+    Container B warms up, A creates a tag and syncs again, then B needs
+    the tag: B has to find it instead of creating it a second time. Each
+    container is a separate copy of the tag_index module.
+    """
+    connection, cursor = setup_templates_sqlite()
+    connections.CONNECTION_FACTORIES['templates'] = (
+        lambda: (connection, cursor), lambda *_: None
+    )
+    connections.close_all_connections()
+    first, second = (
+        __load_module_copy(tag_index, f'tag_index_container_{i}')
+        for i in range(2)
+    )
+    with FakeAirtableServer(latency=0) as fake:
+        for single_index in (first, second):
+            # Only the records created after a sync are fetched again.
+            single_index.SYNC_OVERLAP = timedelta(0)
+        # The sync watermark has a one second resolution.
+        for single_index, tag, pause in (
+                (second, 'Madrid', 0), (first, 'Sevilla', 0),
+                (first, 'Madrid', 1.1), (second, 'Sevilla', 1.1),
+        ):
+            sleep(pause)
+            single_index.resolve_tags(
+                'appBenchmark', 'tblTags', [tag], 'key', fake.api_url
+            )
+        created = [
+            single_record['fields']['Tag']
+            for single_record in fake.tables['/v0/appBenchmark/tblTags']
+        ]
+    connections.close_all_connections()
+    connection.close()
+    if sorted(created) != ['Madrid', 'Sevilla']:
+        raise AssertionError(f'Tags created across containers: {created}')
+
+
+def __load_module_copy(module, name):
+    spec = importlib.util.spec_from_file_location(name, module.__file__)
+    copy = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(copy)
+    return copy
+
+
+def run_airtable_stages(size):
+    results = {}
+    questions = make_questions(min(size, UPLOAD_CARDS))
+    connection, cursor = setup_templates_sqlite()
+    connections.CONNECTION_FACTORIES['templates'] = (
+        lambda: (connection, cursor), lambda *_: None
+    )
+    connections.close_all_connections()
+    tag_index.clear_tag_indices()
+    with FakeAirtableServer(latency=0.05) as fake:
+        existing_count = min(size, EXISTING_TAGS_CAP)
+        for i in range(existing_count):
+            fake.create('/v0/appBenchmark/tblTags', {'Tag': f'Tag {i}'})
+        tags = {
+            f'Tag {i}' for i in range(
+                existing_count - NEW_TAGS, existing_count + NEW_TAGS
+            )
+        }
+        start = perf_counter()
+        resolved = tag_index.resolve_tags(
+            'appBenchmark', 'tblTags', tags, 'key', fake.api_url
+        )
+        results['tag_resolution'] = __result(
+            perf_counter() - start, len(resolved)
+        )
+        # A new container: empty in-process cache, index kept in templates.
+        tag_index.clear_tag_indices()
+        start = perf_counter()
+        resolved = tag_index.resolve_tags(
+            'appBenchmark', 'tblTags', tags, 'key', fake.api_url
+        )
+        results['tag_resolution_cold_start'] = __result(
+            perf_counter() - start, len(resolved)
+        )
+        records = [
+            {'Card': q.text, 'Tags': q.tags, 'Tier': q.difficulty}
+            for q in questions
+        ]
+        start = perf_counter()
+        result = create_records(
+            'appBenchmark', 'tblQuestions', records, 'key',
+            api_url=fake.api_url
+        )
+        results['upload'] = __result(
+            perf_counter() - start, len(result.created)
+        )
+    connections.close_all_connections()
+    connection.close()
+    return results
+
+
+def compare_with_baseline(results, baseline, threshold, min_delta):
+    regressions = []
+    for size, metrics in results.items():
+        for name, single_result in metrics.items():
+            reference = baseline.get(size, {}).get(name)
+            if reference is None:
+                continue
+            seconds = single_result['seconds']
+            ratio = seconds / max(reference['seconds'], 1e-9)
+            marker = ''
+            if ratio > 1 + threshold and (
+                    seconds - reference['seconds'] > min_delta
+            ):
+                marker = '  <-- regression'
+                regressions.append((size, name, ratio))
+            print_msg(f'{size:>7} {name:<55} {ratio:6.2f}x baseline{marker}')
+    return regressions
+
+
+def __result(seconds, items):
+    return {
+        'seconds': round(seconds, 6),
+        'items': items,
+        'items_per_second': round(items / seconds, 1) if seconds > 0 else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[1000, 10000, 100000]
+    )
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    parser.add_argument(
+        '--min-delta-ms', type=float, default=5,
+        help='ignore slowdowns smaller than this, they are timer noise'
+    )
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    question_pool.QUESTIONS_BLOOM_FILTER_PATH = os.path.join(
+        workdir, 'questions.bloom'
+    )
+    # The handler stages are read from the stage timers.
+    instrumentation.METRICS_ENABLED = True
+    fixture = SuperleagueFixture()
+    install_fixture_snapshot_loaders(fixture)
+    install_synthetic_generators()
+    check_tag_index_across_containers()
+    results = {}
+    for size in args.sizes:
+        key = str(size)
+        results[key] = run_generators(fixture, size)
+        results[key].update(run_snapshot_stages(fixture))
+        results[key].update(run_templates_stages(size))
+        results[key].update(run_handler_stages(size))
+        results[key].update(run_airtable_stages(size))
+        for name, single_result in results[key].items():
+            print_msg(
+                f'{size:>7} {name:<55} '
+                f'{single_result["seconds"] * 1000:10.1f} ms '
+                f'{single_result["items_per_second"]:>12,.0f} items/s'
+            )
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf8') as f:
+            dump(results, f, indent=2)
+        print_msg(f'Baseline saved to {args.baseline}')
+        return 0
+    if not os.path.exists(args.baseline):
+        print_msg('No baseline to compare with; run with --save-baseline.')
+        return 0
+    with open(args.baseline, 'r', encoding='utf8') as f:
+        baseline = load(f)
+    regressions = compare_with_baseline(
+        results, baseline, args.threshold, args.min_delta_ms / 1000
+    )
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,244 @@
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+import sqlite3
+import threading
+from time import monotonic, sleep
+from urllib.parse import parse_qs, urlparse
+
+TEMPLATES_TABLE_DDL = (
+    'CREATE TABLE templates.templates ('
+    'question TEXT, tags TEXT, parent_tags TEXT, difficulty TEXT, '
+    'template TEXT, answer INTEGER, insert_time TEXT, in_use INTEGER, '
+    'question_hash TEXT, claim_id TEXT, claimed_at TEXT)'
+)
+
+GENERATOR_STATS_TABLE_DDL = (
+    'CREATE TABLE templates.generator_stats ('
+    'team_id INTEGER, generator TEXT, requested REAL, produced REAL, '
+    'unique_count REAL, updated_at TEXT, PRIMARY KEY (team_id, generator))'
+)
+ROW_LOCK_PATTERN = re.compile(r'\s+FOR UPDATE( OF \w+)?( SKIP LOCKED)?')
+UPSERT_VALUES_PATTERN = re.compile(r'VALUES\((\w+)\)')
+MODIFIED_AFTER_PATTERN = re.compile(
+    r"IS_AFTER\(LAST_MODIFIED_TIME\(\), DATETIME_PARSE\('([^']+)'\)\)"
+)
+
+
+def to_sqlite(query):
+    """Rewrites the MySQL dialect the modules use into SQLite's."""
+    query = ROW_LOCK_PATTERN.sub('', query)
+    if 'ON DUPLICATE KEY UPDATE' in query:
+        query = UPSERT_VALUES_PATTERN.sub(r'excluded.\1', query.replace(
+            'ON DUPLICATE KEY UPDATE', 'ON CONFLICT DO UPDATE SET'
+        ))
+    query = query.replace('UTC_TIMESTAMP()', 'CURRENT_TIMESTAMP')
+    return query.replace('%s', '?')
+
+
+class SqliteCursor:
+    """Cursor wrapper that accepts the MySQL dialect of the modules.
+
+    Row locking clauses are dropped, SQLite locks the whole database.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        self._cursor.execute(to_sqlite(query), params)
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(to_sqlite(query), seq_of_params)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class SqliteConnection:
+    """Connection wrapper that hands out `%s`-style cursors."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, prepared=False):
+        return SqliteCursor(self._connection.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+QUESTION_PARENT_TAGS_TABLE_DDL = (
+    'CREATE TABLE templates.question_parent_tags ('
+    'parent_tag TEXT NOT NULL, question_hash TEXT NOT NULL, '
+    'PRIMARY KEY (parent_tag, question_hash))'
+)
+AIRTABLE_TAGS_TABLE_DDL = (
+    'CREATE TABLE templates.airtable_tags ('
+    'base_id TEXT, table_id TEXT, tag TEXT, record_id TEXT, '
+    'PRIMARY KEY (base_id, table_id, tag))'
+)
+AIRTABLE_TAGS_SYNC_STATE_TABLE_DDL = (
+    'CREATE TABLE templates.airtable_tags_sync_state ('
+    'base_id TEXT, table_id TEXT, synced_at TEXT, full_synced_at TEXT, '
+    'PRIMARY KEY (base_id, table_id))'
+)
+
+
+def connect_sqlite():
+    connection = SqliteConnection(sqlite3.connect(':memory:'))
+    return connection, connection.cursor()
+
+
+def setup_templates_sqlite():
+    connection = sqlite3.connect(':memory:')
+    connection.execute("ATTACH DATABASE ':memory:' AS templates")
+    connection.execute(TEMPLATES_TABLE_DDL)
+    connection.execute(
+        'CREATE INDEX templates.ix_templates_question_hash '
+        'ON templates (question_hash)'
+    )
+    connection.execute(QUESTION_PARENT_TAGS_TABLE_DDL)
+    connection.execute(AIRTABLE_TAGS_TABLE_DDL)
+    connection.execute(AIRTABLE_TAGS_SYNC_STATE_TABLE_DDL)
+    connection.execute(GENERATOR_STATS_TABLE_DDL)
+    connection = SqliteConnection(connection)
+    return connection, connection.cursor()
+
+
+class FakeAirtableServer:
+    """Local stand-in for the AirTable REST API.
+
+    Supports batch create (`POST /v0/<base>/<table>`) and paginated list
+    (`GET /v0/<base>/<table>`, with the incremental sync filter), answers
+    429 above `requests_per_second` and adds `latency` seconds to every
+    request.
+    """
+
+    def __init__(self, requests_per_second=5, latency=0.05):
+        self.requests_per_second = requests_per_second
+        self.latency = latency
+        self.tables = {}
+        self.requests_count = 0
+        self.lock = threading.Lock()
+        self.__recent_requests = []
+        self.__next_id = 0
+        self.__server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), self.__make_handler()
+        )
+        self.__thread = threading.Thread(
+            target=self.__server.serve_forever, daemon=True
+        )
+
+    @property
+    def api_url(self):
+        host, port = self.__server.server_address
+        return f'http://{host}:{port}/v0'
+
+    def __enter__(self):
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def create(self, table_path, fields):
+        with self.lock:
+            self.__next_id += 1
+            record_id = f'rec{self.__next_id:014d}'
+            record = {
+                'id': record_id,
+                'createdTime': datetime.utcnow().isoformat() + 'Z',
+                'fields': dict(fields, Record_ID=record_id),
+            }
+            self.tables.setdefault(table_path, []).append(record)
+        return record
+
+    def filter_records(self, records, formula):
+        """Applies the `LAST_MODIFIED_TIME()` filter of incremental syncs.
+
+        Records are never modified here, so their creation time is used.
+        """
+        since = datetime.strptime(
+            MODIFIED_AFTER_PATTERN.fullmatch(formula).group(1),
+            '%Y-%m-%dT%H:%M:%S.%fZ'
+        )
+        return [
+            single_record for single_record in records
+            if datetime.fromisoformat(single_record['createdTime'][:-1])
+            > since
+        ]
+
+    def is_rate_limited(self):
+        with self.lock:
+            self.requests_count += 1
+            now = monotonic()
+            self.__recent_requests = [
+                t for t in self.__recent_requests if now - t < 1
+            ] + [now]
+            return len(self.__recent_requests) > self.requests_per_second
+
+    def __make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                sleep(fake.latency)
+                if fake.is_rate_limited():
+                    return self.__reply(429, {'errors': 'RATE_LIMIT'})
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                offset = int(query.get('offset', ['0'])[0])
+                page_size = int(query.get('pageSize', ['100'])[0])
+                records = fake.tables.get(url.path, [])
+                if 'filterByFormula' in query:
+                    records = fake.filter_records(
+                        records, query['filterByFormula'][0]
+                    )
+                body = {'records': records[offset:offset + page_size]}
+                if offset + page_size < len(records):
+                    body['offset'] = str(offset + page_size)
+                self.__reply(200, body)
+
+            def do_POST(self):
+                sleep(fake.latency)
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length))
+                if fake.is_rate_limited():
+                    return self.__reply(429, {'errors': 'RATE_LIMIT'})
+                table_path = urlparse(self.path).path
+                if 'records' in payload:
+                    records = [
+                        fake.create(table_path, r['fields'])
+                        for r in payload['records']
+                    ]
+                    self.__reply(200, {'records': records})
+                else:
+                    self.__reply(
+                        200, fake.create(table_path, payload['fields'])
+                    )
+
+            def __reply(self, status, body):
+                data = json.dumps(body).encode('utf8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
@@ -0,0 +1,46 @@
+import os
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over hex digests (e.g. `question_hash`).
+
+    Bit positions are derived from the digest itself with double hashing,
+    so no extra hashing is done on lookup.
+    """
+    __slots__ = ('size_bits', 'hash_count', 'bits')
+
+    def __init__(self, size_bits=2 ** 23, hash_count=7, bits=None):
+        self.size_bits = size_bits
+        self.hash_count = hash_count
+        if bits is None:
+            bits = bytearray(size_bits // 8)
+        self.bits = bits
+
+    def __positions(self, hex_digest):
+        first = int(hex_digest[:16], 16)
+        second = int(hex_digest[16:32], 16) | 1
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size_bits
+
+    def add(self, hex_digest):
+        for position in self.__positions(hex_digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, hex_digest):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.__positions(hex_digest)
+        )
+
+    def save(self, path):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, size_bits=2 ** 23, hash_count=7):
+        if os.path.exists(path) and os.path.getsize(path) == size_bits // 8:
+            with open(path, 'rb') as f:
+                return cls(size_bits, hash_count, bytearray(f.read()))
+        return cls(size_bits, hash_count)
@@ -0,0 +1,169 @@
+from contextlib import contextmanager
+import os
+import threading
+from time import monotonic
+
+HEALTH_CHECK_INTERVAL = float(
+    os.environ.get('DB_HEALTH_CHECK_INTERVAL_SECONDS', 30)
+)
+# db -> (setup() -> (connection, cursor), close(connection, cursor)).
+CONNECTION_FACTORIES = {}
+try:
+    from db.superleague import (
+        setup_connection_to_superleague,
+        close_connection_to_superleague
+    )
+    from db.templates import (
+        setup_connection_to_templates_db,
+        close_connection_to_templates_db
+    )
+except ImportError:
+    # The offline benchmarks run without the db package and install their
+    # own factories.
+    pass
+else:
+    CONNECTION_FACTORIES['templates'] = (
+        setup_connection_to_templates_db, close_connection_to_templates_db
+    )
+    CONNECTION_FACTORIES['superleague'] = (
+        setup_connection_to_superleague, close_connection_to_superleague
+    )
+
+# Connections are kept per thread and per database. They live at module
+# level, so they survive warm Lambda invocations. __all_connections also
+# records the owning thread, so the connections of threads that have
+# exited (e.g. batch generation workers) can be closed.
+__pool = threading.local()
+__all_connections = []
+__all_connections_lock = threading.Lock()
+
+
+def templates_connection(prepared=False):
+    return pooled_connection('templates', prepared)
+
+
+def superleague_connection(prepared=False):
+    return pooled_connection('superleague', prepared)
+
+
+# A prepared cursor keeps the last statement prepared on the server and
+# only sends the parameters while the same statement keeps coming in. It
+# suits repeated lookups; executemany on it sends one round trip per row,
+# so bulk inserts stay on the regular cursor.
+@contextmanager
+def pooled_connection(db_name, prepared=False):
+    connection, cursor = __acquire(db_name)
+    single_entry = __get_thread_connections()[db_name]
+    if prepared:
+        cursor = __get_prepared_cursor(db_name)
+    try:
+        yield connection, cursor
+        connection.commit()
+    except Exception:
+        # The connection may have died mid-query: the rollback must not
+        # hide the original error, and the connection is not reused.
+        try:
+            connection.rollback()
+        except Exception:
+            pass
+        __discard(db_name)
+        raise
+    single_entry[2] = monotonic()
+
+
+@contextmanager
+def dedicated_connection(db_name):
+    setup_connection, close_connection = CONNECTION_FACTORIES[db_name]
+    connection, cursor = setup_connection()
+    try:
+        yield connection, cursor
+    finally:
+        close_connection(connection, cursor)
+
+
+def close_all_connections():
+    with __all_connections_lock:
+        for _, db_name, single_entry in __all_connections:
+            __close_quietly(db_name, single_entry)
+        __all_connections.clear()
+    __pool.connections = {}
+
+
+def __acquire(db_name):
+    thread_connections = __get_thread_connections()
+    single_entry = thread_connections.get(db_name)
+    if single_entry is not None and not __is_healthy(single_entry):
+        __discard(db_name)
+        single_entry = None
+    if single_entry is None:
+        __close_connections_of_exited_threads()
+        setup_connection, _ = CONNECTION_FACTORIES[db_name]
+        connection, cursor = setup_connection()
+        single_entry = [connection, cursor, monotonic(), None]
+        thread_connections[db_name] = single_entry
+        with __all_connections_lock:
+            __all_connections.append(
+                (threading.current_thread(), db_name, single_entry)
+            )
+    return single_entry[0], single_entry[1]
+
+
+def __close_connections_of_exited_threads():
+    with __all_connections_lock:
+        exited = [c for c in __all_connections if not c[0].is_alive()]
+        __all_connections[:] = [
+            c for c in __all_connections if c[0].is_alive()
+        ]
+    for _, db_name, single_entry in exited:
+        __close_quietly(db_name, single_entry)
+
+
+def __discard(db_name):
+    single_entry = __get_thread_connections().pop(db_name, None)
+    if single_entry is not None:
+        __forget(single_entry)
+        __close_quietly(db_name, single_entry)
+
+
+def __forget(single_entry):
+    with __all_connections_lock:
+        __all_connections[:] = [
+            c for c in __all_connections if c[2] is not single_entry
+        ]
+
+
+def __get_prepared_cursor(db_name):
+    single_entry = __get_thread_connections()[db_name]
+    if single_entry[3] is None:
+        single_entry[3] = single_entry[0].cursor(prepared=True)
+    return single_entry[3]
+
+
+def __get_thread_connections():
+    if not hasattr(__pool, 'connections'):
+        __pool.connections = {}
+    return __pool.connections
+
+
+def __is_healthy(single_entry):
+    connection, _, last_used, _ = single_entry
+    if monotonic() - last_used < HEALTH_CHECK_INTERVAL:
+        return True
+    try:
+        connection.ping(reconnect=False)
+        return True
+    except Exception:
+        return False
+
+
+def __close_quietly(db_name, single_entry):
+    _, close_connection = CONNECTION_FACTORIES[db_name]
+    if single_entry[3] is not None:
+        try:
+            single_entry[3].close()
+        except Exception:
+            pass
+    try:
+        close_connection(single_entry[0], single_entry[1])
+    except Exception:
+        pass
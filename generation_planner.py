@@ -0,0 +1,89 @@
+from math import ceil
+import os
+
+from utils import select_query
+
+GENERATION_SAFETY_MARGIN = float(
+    os.environ.get('GENERATION_SAFETY_MARGIN', 1.2)
+)
+GENERATION_TOP_UP_ROUNDS = int(os.environ.get('GENERATION_TOP_UP_ROUNDS', 1))
+# Without history a generator is assumed to deliver one unique card per
+# three requested, which is what the fixed 3x multiplier used to assume.
+DEFAULT_YIELD = 1 / 3
+MIN_YIELD = 0.05
+MIN_REQUESTED_FOR_STATS = 20
+# Weight of the previous history when a run is recorded, so yields follow
+# the data as the team's stock of unused combinations shrinks.
+STATS_DECAY = 0.8
+
+
+def load_generator_stats(cursor, team_id):
+    rows = select_query(
+        cursor, 'generator, requested, produced, unique_count',
+        'generator_stats', 'team_id = %s', 'templates', (team_id,)
+    )
+    return {
+        generator: (float(requested), float(produced), float(unique_count))
+        for generator, requested, produced, unique_count in rows
+    }
+
+
+def record_generator_stats(cursor, team_id, requested, produced, unique):
+    rows = [
+        (
+            team_id, generator, count,
+            produced.get(generator, 0), unique.get(generator, 0)
+        )
+        for generator, count in requested.items() if count > 0
+    ]
+    cursor.executemany(
+        'INSERT INTO templates.generator_stats '
+        '(team_id, generator, requested, produced, unique_count, updated_at) '
+        'VALUES (%s, %s, %s, %s, %s, UTC_TIMESTAMP()) '
+        'ON DUPLICATE KEY UPDATE '
+        f'requested = {STATS_DECAY} * requested + VALUES(requested), '
+        f'produced = {STATS_DECAY} * produced + VALUES(produced), '
+        f'unique_count = {STATS_DECAY} * unique_count + VALUES(unique_count), '
+        'updated_at = VALUES(updated_at)',
+        rows
+    )
+
+
+def expected_yield(stats, generator):
+    requested, _, unique_count = stats.get(generator, (0, 0, 0))
+    if requested < MIN_REQUESTED_FOR_STATS:
+        return DEFAULT_YIELD
+    return min(1.0, max(MIN_YIELD, unique_count / requested))
+
+
+def plan_generation_counts(
+        ratios, count, stats, margin=GENERATION_SAFETY_MARGIN
+):
+    return {
+        generator: __request_for(ratio * count, stats, generator, margin)
+        for generator, ratio in ratios.items()
+    }
+
+
+def plan_top_up_counts(
+        ratios, missing_count, stats, margin=GENERATION_SAFETY_MARGIN
+):
+    # Spread the shortfall over the generators that actually deliver;
+    # asking an exhausted generator for more does not help.
+    weights = {
+        generator: ratio * expected_yield(stats, generator)
+        for generator, ratio in ratios.items()
+    }
+    total_weight = sum(weights.values())
+    return {
+        generator: __request_for(
+            missing_count * weight / total_weight, stats, generator, margin
+        )
+        for generator, weight in weights.items()
+    }
+
+
+def __request_for(desired, stats, generator, margin):
+    if desired <= 0:
+        return 0
+    return int(ceil(desired * margin / expected_yield(stats, generator)))
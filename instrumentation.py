@@ -0,0 +1,108 @@
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from json import dumps
+import os
+import threading
+from time import perf_counter, time
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '0') == '1'
+PROFILE_STAGE = os.environ.get('PROFILE_STAGE')
+METRICS_NAMESPACE = os.environ.get(
+    'METRICS_NAMESPACE', 'FootballQuestionsGeneration'
+)
+
+__NULL_STAGE = nullcontext()
+__lock = threading.Lock()
+__stages = {}
+__counters = {}
+
+
+def stage(name):
+    if not METRICS_ENABLED and PROFILE_STAGE != name:
+        return __NULL_STAGE
+    return __timed_stage(name)
+
+
+def timed(name=None):
+    def decorator(function):
+        stage_name = name or function.__name__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    if not METRICS_ENABLED:
+        return
+    with __lock:
+        __counters[name] = __counters.get(name, 0) + value
+
+
+def reset_metrics():
+    with __lock:
+        __stages.clear()
+        __counters.clear()
+
+
+def get_metrics():
+    with __lock:
+        return dict(__stages), dict(__counters)
+
+
+def emit_summary(**dimensions):
+    if not METRICS_ENABLED:
+        return None
+    stages, counters = get_metrics()
+    metrics = [
+        {'Name': f'{name}.ms', 'Unit': 'Milliseconds'} for name in stages
+    ]
+    metrics += [{'Name': name, 'Unit': 'Count'} for name in counters]
+    summary = {
+        '_aws': {
+            'Timestamp': int(time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [sorted(dimensions)],
+                'Metrics': metrics,
+            }],
+        },
+    }
+    summary.update({k: str(v) for k, v in dimensions.items()})
+    summary.update({
+        f'{name}.ms': round(seconds * 1000, 3)
+        for name, seconds in stages.items()
+    })
+    summary.update(counters)
+    print(dumps(summary))
+    return summary
+
+
+@contextmanager
+def __timed_stage(name):
+    profiler = None
+    if PROFILE_STAGE == name:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            __print_profile(name, profiler)
+        with __lock:
+            __stages[name] = __stages.get(name, 0) + elapsed
+
+
+def __print_profile(name, profiler):
+    import io
+    import pstats
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(30)
+    print(f'[profile] {name}\n{out.getvalue()}')
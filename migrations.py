@@ -0,0 +1,147 @@
+import ast
+from json import dumps
+
+from connections import templates_connection
+from utils import (
+    select_query, bulk_insert_into_query, split_into_chunks, print_msg
+)
+
+
+def backfill_question_parent_tags(cursor):
+    rows = select_query(
+        cursor, 'question_hash, parent_tags', 'templates', db_name='templates'
+    )
+    parent_tags_rows = {
+        (single_parent_tag, single_hash)
+        for single_hash, parent_tags in rows
+        for single_parent_tag in ast.literal_eval(parent_tags)
+    }
+    bulk_insert_into_query(
+        cursor, 'question_parent_tags', ('parent_tag', 'question_hash'),
+        parent_tags_rows, 'templates'
+    )
+
+
+def convert_tags_to_json(cursor):
+    rows = select_query(
+        cursor, 'question_hash, tags, parent_tags', 'templates',
+        db_name='templates'
+    )
+    json_rows = [
+        (
+            dumps(ast.literal_eval(tags), ensure_ascii=False),
+            dumps(ast.literal_eval(parent_tags), ensure_ascii=False),
+            single_hash
+        )
+        for single_hash, tags, parent_tags in rows
+    ]
+    for chunk in split_into_chunks(json_rows, 1000):
+        cursor.executemany(
+            'UPDATE templates.templates SET tags = %s, parent_tags = %s '
+            'WHERE question_hash = %s',
+            chunk
+        )
+
+
+MIGRATIONS = (
+    (
+        '0001_add_question_hash',
+        (
+            'ALTER TABLE templates.templates '
+            'ADD COLUMN question_hash CHAR(40) NULL',
+            'UPDATE templates.templates '
+            'SET question_hash = SHA1(CONVERT(question USING utf8mb4)) '
+            'WHERE question_hash IS NULL',
+            'ALTER TABLE templates.templates '
+            'ADD INDEX ix_templates_question_hash (question_hash)',
+        ),
+    ),
+    (
+        '0002_add_question_parent_tags',
+        (
+            'CREATE TABLE templates.question_parent_tags ('
+            'parent_tag VARCHAR(64) NOT NULL, '
+            'question_hash CHAR(40) NOT NULL, '
+            'PRIMARY KEY (parent_tag, question_hash))',
+            backfill_question_parent_tags,
+        ),
+    ),
+    (
+        '0003_store_tags_as_json',
+        (
+            convert_tags_to_json,
+        ),
+    ),
+    (
+        '0004_add_generator_stats',
+        (
+            'CREATE TABLE templates.generator_stats ('
+            'team_id INT NOT NULL, '
+            'generator VARCHAR(128) NOT NULL, '
+            'requested DOUBLE NOT NULL, '
+            'produced DOUBLE NOT NULL, '
+            'unique_count DOUBLE NOT NULL, '
+            'updated_at DATETIME NOT NULL, '
+            'PRIMARY KEY (team_id, generator))',
+        ),
+    ),
+    (
+        '0005_add_question_claims',
+        (
+            'ALTER TABLE templates.templates '
+            'ADD COLUMN claim_id CHAR(32) NULL, '
+            'ADD COLUMN claimed_at DATETIME NULL',
+            'ALTER TABLE templates.templates '
+            'ADD INDEX ix_templates_claim_id (claim_id)',
+        ),
+    ),
+    (
+        '0006_add_airtable_tags',
+        (
+            'CREATE TABLE templates.airtable_tags ('
+            'base_id VARCHAR(32) NOT NULL, '
+            'table_id VARCHAR(32) NOT NULL, '
+            'tag VARCHAR(255) NOT NULL, '
+            'record_id VARCHAR(32) NOT NULL, '
+            'PRIMARY KEY (base_id, table_id, tag))',
+            'CREATE TABLE templates.airtable_tags_sync_state ('
+            'base_id VARCHAR(32) NOT NULL, '
+            'table_id VARCHAR(32) NOT NULL, '
+            'synced_at CHAR(24) NOT NULL, '
+            'full_synced_at CHAR(24) NOT NULL, '
+            'PRIMARY KEY (base_id, table_id))',
+        ),
+    ),
+)
+
+
+def apply_migrations():
+    with templates_connection() as (connection, cursor):
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS templates.schema_migrations ('
+            'name VARCHAR(255) PRIMARY KEY, applied_at DATETIME NOT NULL)'
+        )
+        applied = {
+            name for name, in select_query(
+                cursor, 'name', 'schema_migrations', db_name='templates'
+            )
+        }
+        for name, steps in MIGRATIONS:
+            if name in applied:
+                continue
+            print_msg(f'Applying migration {name}')
+            for single_step in steps:
+                if callable(single_step):
+                    single_step(cursor)
+                else:
+                    cursor.execute(single_step)
+            cursor.execute(
+                'INSERT INTO templates.schema_migrations (name, applied_at) '
+                'VALUES (%s, UTC_TIMESTAMP())',
+                (name,)
+            )
+            connection.commit()
+
+
+if __name__ == '__main__':
+    apply_migrations()
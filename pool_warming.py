@@ -0,0 +1,64 @@
+from json import loads
+import os
+
+from question_pool import (
+    count_not_used_questions_in_rds, generate_new_questions,
+    add_new_questions_to_rds, team_generation_lock
+)
+from utils import print_msg, load_json_as_dict
+
+# JSON list of pools, e.g.
+# [{"teamId": 53, "parentTagRecordId": "rec...", "baseId": "app...",
+#   "tagsTableId": "tbl...", "lowWater": 200, "target": 1000}]
+POOL_WARMING_CONFIG = os.environ.get('POOL_WARMING_CONFIG', '[]')
+DEFAULT_LOW_WATER = 200
+DEFAULT_TARGET = 1000
+
+
+def warming_handler(event, context):
+    pools = (event or {}).get('pools')
+    if pools is None:
+        pools = loads(POOL_WARMING_CONFIG)
+    return {'generated': warm_pools(pools)}
+
+
+def warm_pools_from_file(path_to_json):
+    return warm_pools(load_json_as_dict(path_to_json))
+
+
+def warm_pools(pools):
+    generated = {}
+    for single_pool in pools:
+        generated[single_pool['parentTagRecordId']] = warm_pool(
+            int(single_pool['teamId']),
+            single_pool['parentTagRecordId'],
+            single_pool['baseId'],
+            single_pool['tagsTableId'],
+            single_pool.get('lowWater', DEFAULT_LOW_WATER),
+            single_pool.get('target', DEFAULT_TARGET),
+        )
+    return generated
+
+
+def warm_pool(
+        team_id, parent_tag_record_id, base_id, tags_table_id,
+        low_water=DEFAULT_LOW_WATER, target=DEFAULT_TARGET
+):
+    with team_generation_lock(team_id) as acquired:
+        if not acquired:
+            print_msg(f'Team {team_id} is being warmed elsewhere, skipping.')
+            return 0
+        available = count_not_used_questions_in_rds(parent_tag_record_id)
+        print_msg(
+            f'Pool {parent_tag_record_id} (team {team_id}): '
+            f'{available} unused questions.'
+        )
+        if available >= low_water:
+            return 0
+        new_questions = generate_new_questions(
+            parent_tag_record_id, team_id, target - available,
+            base_id, tags_table_id
+        )
+        add_new_questions_to_rds(parent_tag_record_id, [], new_questions)
+        print_msg(f'Added {len(new_questions)} questions to the pool.')
+        return len(new_questions)
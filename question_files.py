@@ -0,0 +1,139 @@
+from json import dumps, loads
+import gzip
+import os
+
+from questions import as_question
+
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+
+
+class JsonlWriter:
+    """JSONL file written one record per line.
+
+    The file is replaced unless `append` is set. Records are written as
+    they come, so a run can be stopped at any point and continued later by
+    opening the same path again with `append`.
+    """
+    __slots__ = ('path', 'file', 'count')
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.file = open_jsonl(path, 'a' if append else 'w')
+        self.count = 0
+
+    def write(self, record):
+        self.file.write(dumps(record, ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def write_question(self, question):
+        self.write(dict(text=question.text, **question.to_dict()))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def write_questions_jsonl(path, questions, append=False):
+    with JsonlWriter(path, append) as writer:
+        for single_question in questions:
+            writer.write_question(single_question)
+    return writer.count
+
+
+def iterate_jsonl(path, start=0):
+    """Yields the records of a JSONL file, skipping the first `start`.
+
+    A last line that was only partly written is left out, so the file of an
+    interrupted run can be read and then appended to.
+    """
+    with open_jsonl(path, 'r') as f:
+        try:
+            for i, line in enumerate(f):
+                if not line.endswith('\n'):
+                    return
+                if i >= start:
+                    yield loads(line)
+        except (EOFError, gzip.BadGzipFile):
+            # A compressed file cut off in the middle of a block.
+            return
+
+
+def iterate_questions_jsonl(path, start=0):
+    for record in iterate_jsonl(path, start):
+        yield as_question(record['text'], record)
+
+
+def open_jsonl(path, mode):
+    if mode == 'a' and path.endswith(COMPRESSED_SUFFIXES):
+        __drop_truncated_member(path)
+    if path.endswith('.gz'):
+        return gzip.open(path, f'{mode}t', encoding='utf8')
+    if path.endswith('.zst'):
+        # Optional dependency, only needed for .zst files.
+        import zstandard
+        return zstandard.open(path, f'{mode}t', encoding='utf8')
+    if mode == 'a':
+        __drop_partial_line(path)
+    return open(path, mode, encoding='utf8')
+
+
+def __drop_partial_line(path, block_size=64 * 1024):
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            step = min(block_size, position)
+            f.seek(position - step)
+            newline = f.read(step).rfind(b'\n')
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position != end:
+            f.truncate(position)
+
+
+def __drop_truncated_member(path):
+    # Readers stop at a member cut off by an interrupted run, so anything
+    # appended after it could never be read back. The records before it
+    # are rewritten into a fresh file first.
+    if not os.path.exists(path) or not __is_truncated(path):
+        return
+    tmp_path = f'{path}.tmp{os.path.splitext(path)[1]}'
+    with open_jsonl(tmp_path, 'w') as f:
+        for record in iterate_jsonl(path):
+            f.write(dumps(record, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+
+
+def __is_truncated(path, block_size=1024 * 1024):
+    if path.endswith('.gz'):
+        try:
+            with gzip.open(path, 'rb') as f:
+                while len(f.read(block_size)) > 0:
+                    pass
+        except (EOFError, gzip.BadGzipFile):
+            return True
+        return False
+    # A truncated zstd frame reads as empty instead of failing, so the
+    # frames are checked for their end one by one.
+    import zstandard
+    decompressor = None
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            while len(block) > 0:
+                if decompressor is None:
+                    decompressor = zstandard.ZstdDecompressor().decompressobj()
+                decompressor.decompress(block)
+                block = b''
+                if decompressor.eof:
+                    block = decompressor.unused_data
+                    decompressor = None
+    return decompressor is not None
@@ -0,0 +1,305 @@
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import os
+from uuid import uuid4
+
+from airtable_client import AIRTABLE_API_KEY
+from bloom_filter import BloomFilter
+from connections import dedicated_connection, templates_connection
+from instrumentation import stage
+from questions import Question
+from utils import (
+    select_query, select_where_in_query, bulk_insert_into_query,
+    update_query, update_where_in_query, split_into_chunks, question_hash,
+    print_msg
+)
+
+RDS_INSERT_CHUNK_SIZE = int(os.environ.get('RDS_INSERT_CHUNK_SIZE', 1000))
+RDS_UPDATE_CHUNK_SIZE = int(os.environ.get('RDS_UPDATE_CHUNK_SIZE', 1000))
+QUESTIONS_BLOOM_FILTER_PATH = os.environ.get(
+    'QUESTIONS_BLOOM_FILTER_PATH', '/tmp/questions_hashes.bloom'
+)
+QUESTIONS_BLOOM_FILTER_SIZE_BITS = int(
+    os.environ.get('QUESTIONS_BLOOM_FILTER_SIZE_BITS', 2 ** 23)
+)
+TEMPLATES_COLUMNS = (
+    'question', 'tags', 'parent_tags', 'difficulty',
+    'template', 'answer', 'insert_time', 'in_use', 'question_hash'
+)
+# A claim older than this is taken to belong to an invocation that died
+# before marking its questions as used, and the questions are handed out
+# again.
+CLAIM_TIMEOUT_SECONDS = int(os.environ.get('CLAIM_TIMEOUT_SECONDS', 900))
+
+__QUESTIONS_COLUMNS = (
+    't.question, t.tags, t.parent_tags, t.difficulty, '
+    't.template, t.answer, t.insert_time, t.in_use'
+)
+__NOT_USED_FROM = (
+    'question_parent_tags p JOIN templates.templates t '
+    'ON t.question_hash = p.question_hash'
+)
+__NOT_USED_WHERE = (
+    'p.parent_tag = %s AND t.in_use = 0 '
+    'AND (t.claim_id IS NULL OR t.claimed_at < %s)'
+)
+__questions_bloom_filter = None
+
+
+def count_not_used_questions_in_rds(parent_tag_record_id):
+    with templates_connection(prepared=True) as (_, cursor):
+        (count,), = select_query(
+            cursor, 'COUNT(*)', __NOT_USED_FROM, __NOT_USED_WHERE,
+            'templates', (parent_tag_record_id, __get_claims_cut_off()),
+        )
+    return count
+
+
+def new_claim_id():
+    return uuid4().hex
+
+
+def claim_not_used_questions(claim_id, parent_tag_record_id, total_count):
+    """Reserves up to `total_count` unused questions under `claim_id`.
+
+    Rows locked by a concurrent claim are skipped, so invocations running
+    at the same time get disjoint questions.
+    """
+    with templates_connection() as (_, cursor):
+        rows = select_query(
+            cursor, f'{__QUESTIONS_COLUMNS}, t.question_hash',
+            __NOT_USED_FROM, __NOT_USED_WHERE,
+            'templates', (parent_tag_record_id, __get_claims_cut_off()),
+            total_count, 'FOR UPDATE OF t SKIP LOCKED'
+        )
+        update_where_in_query(
+            cursor, 'templates', ('claim_id', 'claimed_at'),
+            (claim_id, __format_timestamp(datetime.utcnow())),
+            'question_hash', [single_row[-1] for single_row in rows],
+            'templates', RDS_UPDATE_CHUNK_SIZE
+        )
+    return [Question.from_row(single_row) for single_row in rows]
+
+
+def mark_claimed_questions_as_used(claim_id):
+    with templates_connection(prepared=True) as (_, cursor):
+        update_query(
+            cursor, 'templates', ('in_use',), (int(True),), 'claim_id = %s',
+            'templates', (claim_id,)
+        )
+
+
+def release_claimed_questions(claim_id, questions):
+    questions_hashes = [
+        question_hash(single_question.text) for single_question in questions
+    ]
+    with templates_connection() as (_, cursor):
+        update_where_in_query(
+            cursor, 'templates', ('claim_id', 'claimed_at'), (None, None),
+            'question_hash', questions_hashes, 'templates',
+            RDS_UPDATE_CHUNK_SIZE, 'claim_id = %s', (claim_id,)
+        )
+
+
+def __get_claims_cut_off():
+    return __format_timestamp(
+        datetime.utcnow() - timedelta(seconds=CLAIM_TIMEOUT_SECONDS)
+    )
+
+
+def __format_timestamp(timestamp):
+    return timestamp.strftime('%Y-%m-%d %H:%M:%S')
+
+
+@contextmanager
+def team_generation_lock(team_id):
+    # A MySQL named lock lives as long as the session that holds it, so it
+    # gets its own connection instead of a pooled one that may be replaced.
+    with dedicated_connection('templates') as (_, cursor):
+        lock_name = f'templates.generation.{team_id}'
+        cursor.execute('SELECT GET_LOCK(%s, 0)', (lock_name,))
+        (acquired,), = cursor.fetchall()
+        try:
+            yield acquired == 1
+        finally:
+            if acquired == 1:
+                cursor.execute('SELECT RELEASE_LOCK(%s)', (lock_name,))
+                cursor.fetchall()
+
+
+def generate_new_questions(
+        parent_tag_record_id, team_id, count, base_id, table_id
+):
+    # The generation subsystem brings numpy and every generator with it, so
+    # it is only imported once a pool actually runs short.
+    import numpy as np
+    from generation_planner import (
+        GENERATION_TOP_UP_ROUNDS, load_generator_stats,
+        record_generator_stats, plan_generation_counts, plan_top_up_counts
+    )
+    from run_industrial_generation import (
+        GENERATORS_RATIOS, run_industrial_generation
+    )
+    with templates_connection() as (_, cursor):
+        stats = load_generator_stats(cursor, team_id)
+    requested = plan_generation_counts(GENERATORS_RATIOS, count, stats)
+    questions = {}
+    for round_index in range(GENERATION_TOP_UP_ROUNDS + 1):
+        with stage('generation'):
+            new_questions = list(__replace_parent_tags_with_record_id(
+                parent_tag_record_id,
+                run_industrial_generation(team_id, count, counts=requested)
+            ))
+        produced = Counter(q.generator for q in new_questions)
+        with stage('exclude_duplicates'):
+            new_questions = [
+                q for q in exclude_duplicates(new_questions)
+                if q.text not in questions
+            ]
+        unique = Counter(q.generator for q in new_questions)
+        questions.update((q.text, q) for q in new_questions)
+        with templates_connection() as (_, cursor):
+            record_generator_stats(
+                cursor, team_id, requested, produced, unique
+            )
+            stats = load_generator_stats(cursor, team_id)
+        missing_count = count - len(questions)
+        if missing_count <= 0 or round_index == GENERATION_TOP_UP_ROUNDS:
+            break
+        print_msg(f'Short by {missing_count} questions, topping up.')
+        requested = plan_top_up_counts(GENERATORS_RATIOS, missing_count, stats)
+    questions = list(questions.values())
+    questions = __replace_tags_with_records_ids(base_id, table_id, questions)
+    np.random.shuffle(questions)
+    return questions
+
+
+def __replace_parent_tags_with_record_id(parent_tag_record_id, questions):
+    for single_question in questions:
+        single_question.parent_tags = [parent_tag_record_id]
+        single_question.answer = bool(single_question.answer)
+        yield single_question
+
+
+def __replace_tags_with_records_ids(base_id, table_id, questions):
+    from tag_index import resolve_tags
+    all_tags = {
+        single_tag for single_question in questions
+        for single_tag in single_question.tags
+    }
+    tags_records_ids = resolve_tags(
+        base_id, table_id, all_tags, AIRTABLE_API_KEY
+    )
+    for single_question in questions:
+        single_question.tags = list({
+            tags_records_ids[single_tag]
+            for single_tag in single_question.tags
+            if single_tag in tags_records_ids
+        })
+    return questions
+
+
+def exclude_duplicates(questions):
+    bloom_filter = __get_questions_bloom_filter()
+    questions_by_hash = {question_hash(q.text): q for q in questions}
+    hashes_to_check = [h for h in questions_by_hash if h not in bloom_filter]
+    for existing_hash in __get_existing_questions_hashes(hashes_to_check):
+        bloom_filter.add(existing_hash)
+    questions = [
+        q for h, q in questions_by_hash.items() if h not in bloom_filter
+    ]
+    return questions
+
+
+def __get_existing_questions_hashes(questions_hashes):
+    if len(questions_hashes) == 0:
+        return []
+    with templates_connection() as (_, cursor):
+        existing_hashes = select_where_in_query(
+            cursor, 'question_hash', 'templates', 'question_hash',
+            questions_hashes, 'templates', RDS_UPDATE_CHUNK_SIZE
+        )
+    return [single_hash for single_hash, in existing_hashes]
+
+
+def __get_questions_bloom_filter():
+    global __questions_bloom_filter
+    if __questions_bloom_filter is None:
+        __questions_bloom_filter = BloomFilter.load(
+            QUESTIONS_BLOOM_FILTER_PATH, QUESTIONS_BLOOM_FILTER_SIZE_BITS
+        )
+    return __questions_bloom_filter
+
+
+def __remember_questions_hashes(questions_hashes):
+    bloom_filter = __get_questions_bloom_filter()
+    for single_hash in questions_hashes:
+        bloom_filter.add(single_hash)
+    bloom_filter.save(QUESTIONS_BLOOM_FILTER_PATH)
+
+
+def add_new_questions_to_rds(
+        parent_tag_record_id, used, not_used, claim_id=None
+):
+    timestamp = __format_timestamp(datetime.utcnow())
+    rows = []
+    # Under a claim the questions handed out now stay unused until their
+    # upload succeeds, like the claimed ones taken from the pool.
+    if claim_id is None:
+        for single_question in used:
+            single_question.in_use = True
+    for single_question in used + not_used:
+        single_question.insert_time = timestamp
+        rows.append(
+            single_question.to_row() + (question_hash(single_question.text),)
+        )
+    with templates_connection() as (_, cursor):
+        bulk_insert_into_query(
+            cursor, 'templates', TEMPLATES_COLUMNS, rows, 'templates',
+            RDS_INSERT_CHUNK_SIZE
+        )
+        bulk_insert_into_query(
+            cursor, 'question_parent_tags', ('parent_tag', 'question_hash'),
+            [(parent_tag_record_id, single_row[-1]) for single_row in rows],
+            'templates', RDS_INSERT_CHUNK_SIZE
+        )
+        if claim_id is not None:
+            update_where_in_query(
+                cursor, 'templates', ('claim_id', 'claimed_at'),
+                (claim_id, timestamp), 'question_hash',
+                [single_row[-1] for single_row in rows[:len(used)]],
+                'templates', RDS_UPDATE_CHUNK_SIZE
+            )
+    __remember_questions_hashes(single_row[-1] for single_row in rows)
+
+
+def load_questions_file_into_rds(
+        path, parent_tag_record_id, base_id, table_id, start=0,
+        chunk_size=RDS_INSERT_CHUNK_SIZE
+):
+    """Adds the questions of a JSONL file to the unused pool of a parent tag.
+
+    The file is read one chunk at a time, so memory does not grow with it.
+    The number of records read is logged after every committed chunk and
+    returned at the end; either can be passed back as `start` to continue
+    an interrupted load.
+    """
+    from question_files import iterate_questions_jsonl
+    read_count, inserted_count = start, 0
+    for chunk in split_into_chunks(
+            iterate_questions_jsonl(path, start), chunk_size
+    ):
+        read_count += len(chunk)
+        chunk = exclude_duplicates(
+            __replace_parent_tags_with_record_id(parent_tag_record_id, chunk)
+        )
+        if len(chunk) > 0:
+            add_new_questions_to_rds(
+                parent_tag_record_id, [],
+                __replace_tags_with_records_ids(base_id, table_id, chunk)
+            )
+        inserted_count += len(chunk)
+        print_msg(f'{path}: committed up to record {read_count}.')
+    print_msg(f'Loaded {inserted_count} new questions from {path}.')
+    return read_count
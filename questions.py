@@ -0,0 +1,104 @@
+from json import dumps, loads
+
+
+class Question:
+    """A single card as it travels from the generators to AirTable.
+
+    Generators still produce dicts; `as_question` converts them.
+    """
+    __slots__ = (
+        'text', 'tags', 'parent_tags', 'difficulty', 'template', 'answer',
+        'insert_time', 'in_use', 'generator'
+    )
+
+    def __init__(
+            self, text, tags, parent_tags, difficulty, template,
+            answer=None, insert_time=None, in_use=False, generator=None
+    ):
+        self.text = text
+        self.tags = tags
+        self.parent_tags = parent_tags
+        self.difficulty = difficulty
+        self.template = template
+        self.answer = answer
+        self.insert_time = insert_time
+        self.in_use = in_use
+        self.generator = generator
+
+    def __repr__(self):
+        return f'Question({self.text!r})'
+
+    def to_row(self):
+        return (
+            self.text, dumps(self.tags, ensure_ascii=False),
+            dumps(self.parent_tags, ensure_ascii=False), self.difficulty,
+            self.template, int(self.answer), self.insert_time,
+            int(self.in_use)
+        )
+
+    def to_dict(self):
+        return {
+            'tags': self.tags,
+            'parent_tags': self.parent_tags,
+            'difficulty': self.difficulty,
+            'template': self.template,
+            'answer': self.answer,
+        }
+
+    @classmethod
+    def from_row(cls, row):
+        text, tags, parent_tags, difficulty, template, answer = row[:6]
+        insert_time, in_use = row[6:8] if len(row) >= 8 else (None, False)
+        return cls(
+            text, loads(tags), loads(parent_tags), difficulty, template,
+            bool(answer), insert_time, bool(in_use)
+        )
+
+
+def as_question(text, question):
+    if isinstance(question, Question):
+        return question
+    return Question(
+        text, question['tags'], question['parent_tags'],
+        question['difficulty'], question['template'],
+        question.get('answer')
+    )
+
+
+class QuestionSink:
+    """Accumulates generator output keyed by question text.
+
+    Accepts dicts, `Question` records, (text, question) pairs or iterables
+    of any of these, so generators may return a dict or yield as they go.
+    A later question with the same text replaces the earlier one, as
+    `merge_dicts` did, without copying what is already collected. When
+    `generator` is given, added questions are attributed to it.
+    """
+    __slots__ = ('questions',)
+
+    def __init__(self):
+        self.questions = {}
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __iter__(self):
+        return iter(self.questions.values())
+
+    def add(self, text, question, generator=None):
+        question = as_question(text, question)
+        if generator is not None:
+            question.generator = generator
+        self.questions[text] = question
+
+    def extend(self, new_questions, generator=None):
+        if isinstance(new_questions, dict):
+            new_questions = new_questions.items()
+        for item in new_questions:
+            if isinstance(item, Question):
+                self.add(item.text, item, generator)
+            elif isinstance(item, dict):
+                self.extend(item, generator)
+            else:
+                self.add(*item, generator=generator)
+        return self
@@ -1,42 +1,15 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from inspect import signature
+import os
 import sys
 
-from db.superleague import (
-    setup_connection_to_superleague,
-    close_connection_to_superleague
-)
-from utils import merge_dicts, print_msg, dump_dict_as_json
-from generate_industrial import (
-    generate_player_played_in_team,
-    generate_player_played_in_team_as_pos,
-    generate_player_played_in_team_as_pos_at_league_season,
-    generate_player_has_never_played_in_team_as_of_limiter,
-    generate_player_played_in_team_as_of_limiter,
-    generate_former_team_player_as_of_limiter,
-    generate_player_wore_shirt_for_team_at_season,
-    generate_player_wore_shirt_for_team_as_of_limiter,
-    generate_team_vs_team_at_season_in_stadium,
-    generate_season_with_final_result,
-    generate_season_without_final_result,
-    generate_winner_beat_no_winner_in_season,
-    generate_team_played_in_league_as_of_limiter,
-    generate_team_win_league_as_of_limiter,
-    generate_team_never_win_league_as_of_limiter,
-    generate_player_moved_to_team_from_team,
-    generate_player_joined_or_left_team_in_year,
-    generate_player_scored_for_team,
-    generate_player_scored_more_than_number_goals,
-    generate_player_scored_more_than_number_goals_in_season,
-    generate_player_scored_for_team_as_of_limiter,
-    generate_player_scored_for_team_as_of_limiter_in_league,
-    generate_player_played_more_than_number,
-    generate_player_played_less_than_number,
-    generate_player_win_league_with_team,
-    generate_player_win_league_with_team_limiter,
-    generate_player_was_team_top_scorer,
-)
-from generate_industrial.tables import (
-    get_teams_abbreviations_dict, get_leagues_abbreviations_dict
-)
+from utils import print_msg, progress, seed_thread_rng
+from instrumentation import stage
+from question_files import write_questions_jsonl
+from questions import QuestionSink
+from team_snapshot import get_team_snapshot
 
 TEAM_ID = 53
 TOTAL_COUNT = 4000
@@ -48,108 +21,275 @@ CUT_OFF_LEFT = {
 CUT_OFF_RIGHT = {
     'default': 2022
 }
+GENERATION_WORKERS = int(os.environ.get('GENERATION_WORKERS', 1))
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 4))
+GENERATORS_RATIOS = {
+    'generate_player_played_in_team': 0.008,
+    'generate_player_played_in_team_as_pos': 0.03,
+    'generate_player_played_in_team_as_pos_at_league_season': 0.151,
+    'generate_player_has_never_played_in_team_as_of_limiter': 0.01,
+    'generate_player_played_in_team_as_of_limiter': 0.044,
+    'generate_former_team_player_as_of_limiter': 0.008,
+    'generate_player_wore_shirt_for_team_at_season': 0.065,
+    'generate_player_wore_shirt_for_team_as_of_limiter': 0.01,
+    'generate_team_vs_team_at_season_in_stadium': 0.096,
+    'generate_season_with_final_result': 0.07,
+    'generate_season_without_final_result': 0.07,
+    'generate_winner_beat_no_winner_in_season': 0.05,
+    'generate_team_played_in_league_as_of_limiter': 0.01,
+    'generate_team_win_league_as_of_limiter': 0.01,
+    'generate_team_never_win_league_as_of_limiter': 0.01,
+    'generate_player_moved_to_team_from_team': 0.05,
+    'generate_player_joined_or_left_team_in_year': 0.04,
+    'generate_player_scored_for_team': 0.03,
+    'generate_player_scored_more_than_number_goals': 0.025,
+    'generate_player_scored_more_than_number_goals_in_season': 0.025,
+    'generate_player_scored_for_team_as_of_limiter': 0.005,
+    'generate_player_scored_for_team_as_of_limiter_in_league': 0.01,
+    'generate_player_played_more_than_number': 0.0175,
+    'generate_player_played_less_than_number': 0.0175,
+    'generate_player_win_league_with_team': 0.05,
+    'generate_player_win_league_with_team_limiter': 0.01,
+    'generate_player_was_team_top_scorer': 0.078,
+}
+# The generators bring numpy and a superleague connection with them, so
+# they are imported on first use; the offline benchmarks install their
+# own in QUESTION_GENERATORS instead.
+QUESTION_GENERATOR_NAMES = (
+    'generate_player_played_in_team',
+    'generate_player_played_in_team_as_pos',
+    'generate_player_played_in_team_as_pos_at_league_season',
+    'generate_player_has_never_played_in_team_as_of_limiter',
+    'generate_player_played_in_team_as_of_limiter',
+    'generate_former_team_player_as_of_limiter',
+    'generate_player_wore_shirt_for_team_at_season',
+    'generate_player_wore_shirt_for_team_as_of_limiter',
+    'generate_team_vs_team_at_season_in_stadium',
+    'generate_season_with_final_result',
+    'generate_season_without_final_result',
+    'generate_winner_beat_no_winner_in_season',
+    'generate_team_played_in_league_as_of_limiter',
+    'generate_team_win_league_as_of_limiter',
+    'generate_team_never_win_league_as_of_limiter',
+    'generate_player_moved_to_team_from_team',
+    'generate_player_joined_or_left_team_in_year',
+    'generate_player_scored_for_team',
+    'generate_player_scored_more_than_number_goals',
+    'generate_player_scored_more_than_number_goals_in_season',
+    'generate_player_scored_for_team_as_of_limiter',
+    'generate_player_scored_for_team_as_of_limiter_in_league',
+    'generate_player_played_more_than_number',
+    'generate_player_played_less_than_number',
+    'generate_player_win_league_with_team',
+    'generate_player_win_league_with_team_limiter',
+    'generate_player_was_team_top_scorer',
+)
+QUESTION_GENERATORS = None
 
 
-def run_industrial_generation(team_id, total_count):
-    counts = __create_questions_counts(total_count)
-    question_generators = (
-        generate_player_played_in_team,
-        generate_player_played_in_team_as_pos,
-        generate_player_played_in_team_as_pos_at_league_season,
-        generate_player_has_never_played_in_team_as_of_limiter,
-        generate_player_played_in_team_as_of_limiter,
-        generate_former_team_player_as_of_limiter,
-        generate_player_wore_shirt_for_team_at_season,
-        generate_player_wore_shirt_for_team_as_of_limiter,
-        generate_team_vs_team_at_season_in_stadium,
-        generate_season_with_final_result,
-        generate_season_without_final_result,
-        generate_winner_beat_no_winner_in_season,
-        generate_team_played_in_league_as_of_limiter,
-        generate_team_win_league_as_of_limiter,
-        generate_team_never_win_league_as_of_limiter,
-        generate_player_moved_to_team_from_team,
-        generate_player_joined_or_left_team_in_year,
-        generate_player_scored_for_team,
-        generate_player_scored_more_than_number_goals,
-        generate_player_scored_more_than_number_goals_in_season,
-        generate_player_scored_for_team_as_of_limiter,
-        generate_player_scored_for_team_as_of_limiter_in_league,
-        generate_player_played_more_than_number,
-        generate_player_played_less_than_number,
-        generate_player_win_league_with_team,
-        generate_player_win_league_with_team_limiter,
-        generate_player_was_team_top_scorer,
-    )
-    questions = {}
-    for single_question_generator in question_generators:
-        print_msg(f'Running {single_question_generator.__name__}')
-        new_questions = single_question_generator(
-            team_id, CUT_OFF_LEFT, CUT_OFF_RIGHT,
-            counts[single_question_generator.__name__]
+def get_question_generators():
+    global QUESTION_GENERATORS
+    if QUESTION_GENERATORS is None:
+        import generate_industrial
+        QUESTION_GENERATORS = tuple(
+            getattr(generate_industrial, name)
+            for name in QUESTION_GENERATOR_NAMES
+        )
+    return QUESTION_GENERATORS
+
+
+def run_industrial_generation(
+        team_id, total_count, workers=GENERATION_WORKERS, seed=None,
+        counts=None
+):
+    if counts is None:
+        counts = __create_questions_counts(total_count)
+    with stage('team_snapshot'):
+        snapshot = get_team_snapshot(
+            team_id,
+            CUT_OFF_LEFT.get(team_id, CUT_OFF_LEFT['default']),
+            CUT_OFF_RIGHT.get(team_id, CUT_OFF_RIGHT['default']),
         )
-        new_count = len(new_questions)
-        print_msg(f'Questions generated with this generator: {new_count}')
-        questions = merge_dicts(questions, new_questions)
-    questions = __post_process_tags(questions)
-    return questions
+    if seed is None and workers > 1:
+        seed = int.from_bytes(os.urandom(4), 'little')
+        print_msg(f'Generation seed: {seed}')
+    question_generators = get_question_generators()
+    seeds = [
+        None if seed is None else seed + i
+        for i in range(len(question_generators))
+    ]
+    tasks = [
+        (
+            single_generator, team_id, counts[single_generator.__name__], s,
+            snapshot
+        )
+        for single_generator, s in zip(question_generators, seeds)
+        if counts.get(single_generator.__name__, 0) > 0
+    ]
+    sink = QuestionSink()
+    with stage('generators'):
+        if workers > 1:
+            with ThreadPoolExecutor(workers) as executor:
+                for new_questions in progress(executor.map(
+                        lambda task: __run_question_generator(*task), tasks
+                ), total=len(tasks), desc='generators'):
+                    sink.extend(*new_questions)
+        else:
+            for task in progress(tasks, desc='generators'):
+                sink.extend(*__run_question_generator(*task))
+    return __post_process_tags(sink, snapshot)
+
+
+def run_batch_generation(teams_counts, workers=BATCH_WORKERS, seed=None):
+    """Generates questions for several teams on a shared worker pool.
+
+    Yields (team_id, questions) as soon as each team is done. Every worker
+    thread keeps its pooled superleague connection between teams, and the
+    snapshot data that does not depend on the team is loaded only once.
+    """
+    generators_count = len(get_question_generators())
+    with ThreadPoolExecutor(workers) as executor:
+        futures = {
+            executor.submit(
+                __run_team_generation, team_id, total_count,
+                None if seed is None else seed + i * generators_count
+            ): team_id
+            for i, (team_id, total_count) in enumerate(teams_counts)
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def __run_team_generation(team_id, total_count, seed):
+    with stage('team_generation'):
+        return list(run_industrial_generation(
+            team_id, total_count, workers=1, seed=seed
+        ))
+
+
+def __run_question_generator(
+        question_generator, team_id, count, seed, snapshot
+):
+    print_msg(f'Running {question_generator.__name__}')
+    kwargs = {}
+    if __accepts_snapshot(question_generator):
+        kwargs['snapshot'] = snapshot
+    seed_thread_rng(seed)
+    try:
+        with stage(f'generator.{question_generator.__name__}'):
+            # Drained here, while the thread is still seeded: a generator
+            # that yields runs only when it is iterated.
+            new_questions = QuestionSink().extend(
+                question_generator(
+                    team_id, CUT_OFF_LEFT, CUT_OFF_RIGHT, count, **kwargs
+                ),
+                question_generator.__name__
+            ).questions
+    finally:
+        seed_thread_rng(None)
+    print_msg(
+        f'Questions generated with {question_generator.__name__}: '
+        f'{len(new_questions)}'
+    )
+    return new_questions, question_generator.__name__
+
+
+@lru_cache(maxsize=None)
+def __accepts_snapshot(question_generator):
+    return 'snapshot' in signature(question_generator).parameters
 
 
 def __create_questions_counts(total_count):
-    counts = {
-        'generate_player_played_in_team': 0.008 * total_count,
-        'generate_player_played_in_team_as_pos': 0.03 * total_count,
-        'generate_player_played_in_team_as_pos_at_league_season': 0.151 * total_count,
-        'generate_player_has_never_played_in_team_as_of_limiter': 0.01 * total_count,
-        'generate_player_played_in_team_as_of_limiter': 0.044 * total_count,
-        'generate_former_team_player_as_of_limiter': 0.008 * total_count,
-        'generate_player_wore_shirt_for_team_at_season': 0.065 * total_count,
-        'generate_player_wore_shirt_for_team_as_of_limiter': 0.01 * total_count,
-        'generate_team_vs_team_at_season_in_stadium': 0.096 * total_count,
-        'generate_season_with_final_result': 0.07 * total_count,
-        'generate_season_without_final_result': 0.07 * total_count,
-        'generate_winner_beat_no_winner_in_season': 0.05 * total_count,
-        'generate_team_played_in_league_as_of_limiter': 0.01 * total_count,
-        'generate_team_win_league_as_of_limiter': 0.01 * total_count,
-        'generate_team_never_win_league_as_of_limiter': 0.01 * total_count,
-        'generate_player_moved_to_team_from_team': 0.05 * total_count,
-        'generate_player_joined_or_left_team_in_year': 0.04 * total_count,
-        'generate_player_scored_for_team': 0.03 * total_count,
-        'generate_player_scored_more_than_number_goals': 0.025 * total_count,
-        'generate_player_scored_more_than_number_goals_in_season': 0.025 * total_count,
-        'generate_player_scored_for_team_as_of_limiter': 0.005 * total_count,
-        'generate_player_scored_for_team_as_of_limiter_in_league': 0.01 * total_count,
-        'generate_player_played_more_than_number': 0.0175 * total_count,
-        'generate_player_played_less_than_number': 0.0175 * total_count,
-        'generate_player_win_league_with_team': 0.05 * total_count,
-        'generate_player_win_league_with_team_limiter': 0.01 * total_count,
-        'generate_player_was_team_top_scorer': 0.078 * total_count,
-    }
-    counts = {k: int(v) for k, v in counts.items()}
+    counts = {k: int(v * total_count) for k, v in GENERATORS_RATIOS.items()}
     return counts
 
 
-def __post_process_tags(questions):
-    connection, cursor = setup_connection_to_superleague()
-    teams_abbreviations = get_teams_abbreviations_dict(cursor)
-    leagues_abbreviations = get_leagues_abbreviations_dict(cursor)
-    for single_q in questions.keys():
-        tags = questions[single_q]['tags']
+def __post_process_tags(questions, snapshot):
+    # Questions share a small tag vocabulary, so every distinct tag is
+    # translated once and the result reused.
+    translations = snapshot.tag_translations
+    processed = {}
+    for single_question in questions:
         processed_tags = []
-        for i in range(len(tags)):
-            single_tag = tags[i]
-            single_tag = teams_abbreviations.get(single_tag, single_tag)
-            single_tag = leagues_abbreviations.get(single_tag, single_tag)
-            if single_tag is not None and single_tag.strip() != '':
-                processed_tags.append(single_tag)
-        questions[single_q]['tags'] = processed_tags
-    close_connection_to_superleague(connection, cursor)
-    return questions
+        for single_tag in single_question.tags:
+            if single_tag not in processed:
+                processed[single_tag] = __process_tag(single_tag, translations)
+            if processed[single_tag] is not None:
+                processed_tags.append(processed[single_tag])
+        single_question.tags = processed_tags
+        yield single_question
+
+
+def __process_tag(tag, translations):
+    tag = translations.get(tag, tag)
+    if tag is None or tag.strip() == '':
+        return None
+    return sys.intern(tag)
+
+
+def __parse_teams_counts(value):
+    teams_counts = []
+    for single_team in value.split(','):
+        team_id, _, total_count = single_team.partition(':')
+        teams_counts.append(
+            (int(team_id), int(total_count) if total_count else TOTAL_COUNT)
+        )
+    return teams_counts
+
+
+def __parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--warm-pools', metavar='CONFIG_JSON',
+        help='top up the unused pools listed in CONFIG_JSON instead of '
+             'dumping generated questions'
+    )
+    parser.add_argument(
+        '--teams', metavar='TEAM_ID:COUNT,...', type=__parse_teams_counts,
+        help='generate for several teams at once, e.g. 53:4000,54:2000; '
+             'each team is written to its own file as soon as it is done'
+    )
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument(
+        '--compress', choices=('gz', 'zst'),
+        help='compress the JSONL output (zst needs the zstandard package)'
+    )
+    parser.add_argument(
+        '--append', action='store_true',
+        help='append to existing output files, e.g. to resume an '
+             'interrupted run, instead of replacing them'
+    )
+    return parser.parse_args()
+
+
+def __output_path(args, name):
+    path = os.path.join(args.output_dir, f'{name}.jsonl')
+    return path if args.compress is None else f'{path}.{args.compress}'
 
 
 if __name__ == '__main__':
-    questions = run_industrial_generation(TEAM_ID, TOTAL_COUNT)
+    args = __parse_arguments()
+    if args.warm_pools is not None:
+        from pool_warming import warm_pools_from_file
+        warm_pools_from_file(args.warm_pools)
+        sys.exit(0)
+    if args.teams is not None:
+        for team_id, questions in run_batch_generation(
+                args.teams, args.workers, args.seed
+        ):
+            path = __output_path(args, f'industrial_{team_id}_v0.5')
+            write_questions_jsonl(path, questions, args.append)
+            print_msg(
+                f'Team {team_id}: {len(questions)} questions written to '
+                f'{path}.'
+            )
+        sys.exit(0)
+    written_count = write_questions_jsonl(
+        __output_path(args, 'industrial_atletico_v0.5'),
+        run_industrial_generation(TEAM_ID, TOTAL_COUNT), args.append
+    )
     print_msg(
-        f'Questions are ready. Totally generated: {len(questions)} questions.'
+        f'Questions are ready. Totally generated: {written_count} questions.'
     )
-    dump_dict_as_json('industrial_atletico_v0.5.json', questions)
@@ -0,0 +1,169 @@
+from datetime import datetime, timedelta
+import os
+
+from airtable_client import AIRTABLE_API_URL, create_records, iterate_records
+from connections import templates_connection
+from instrumentation import stage
+from text_normalization import preprocess_tag
+from utils import (
+    bulk_insert_into_query, print_msg, select_query, select_where_in_query
+)
+
+FULL_RESYNC_INTERVAL = timedelta(
+    hours=float(os.environ.get('TAG_INDEX_FULL_RESYNC_HOURS', 24))
+)
+# Records modified while a sync is running may carry a timestamp a bit
+# older than the moment we stored, so the next sync looks back this far.
+SYNC_OVERLAP = timedelta(seconds=60)
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.000Z'
+
+TAGS_COLUMNS = ('base_id', 'table_id', 'tag', 'record_id')
+
+# The index and its sync state live in templates.airtable_tags and
+# templates.airtable_tags_sync_state, so they survive cold starts and are
+# shared by all containers. __indices is the in-process front cache:
+# (base_id, table_id) -> {preprocessed tag: record id}, and __sync_states
+# the (synced_at, full_synced_at) it is up to date with. The shared state
+# is only read on a cold start: another container may have synced past
+# tags this one has not seen yet.
+__indices = {}
+__sync_states = {}
+
+
+def resolve_tags(base_id, table_id, tags, api_key, api_url=AIRTABLE_API_URL):
+    with stage('tag_sync'):
+        index = sync_tag_index(base_id, table_id, api_key, api_url)
+    preprocessed = {
+        single_tag: preprocess_tag(single_tag) for single_tag in tags
+    }
+    missing = {}
+    for single_tag, key in preprocessed.items():
+        if key not in index and key not in missing:
+            missing[key] = single_tag
+    if len(missing) > 0:
+        # Other containers may have created some of them since our sync.
+        __load_stored_tags(base_id, table_id, index, missing)
+        missing = {k: v for k, v in missing.items() if k not in index}
+    if len(missing) > 0:
+        with stage('tag_create'):
+            __create_missing_tags(
+                base_id, table_id, api_key, api_url, index, missing
+            )
+    return {
+        single_tag: index[key] for single_tag, key in preprocessed.items()
+        if key in index
+    }
+
+
+def sync_tag_index(base_id, table_id, api_key, api_url=AIRTABLE_API_URL):
+    key = (base_id, table_id)
+    index = __indices.get(key)
+    state = __sync_states.get(key)
+    if index is None:
+        with templates_connection() as (_, cursor):
+            index = dict(select_query(
+                cursor, 'tag, record_id', 'airtable_tags',
+                'base_id = %s AND table_id = %s', 'templates',
+                (base_id, table_id)
+            ))
+            state = select_query(
+                cursor, 'synced_at, full_synced_at',
+                'airtable_tags_sync_state', 'base_id = %s AND table_id = %s',
+                'templates', (base_id, table_id)
+            )
+        state = state[0] if len(state) > 0 else None
+        __indices[key] = index
+    started_at = datetime.utcnow()
+    full_sync = state is None or (
+        started_at - datetime.strptime(state[1], TIMESTAMP_FORMAT)
+        > FULL_RESYNC_INTERVAL
+    )
+    if full_sync:
+        formula = None
+        full_synced_at = started_at.strftime(TIMESTAMP_FORMAT)
+    else:
+        since = datetime.strptime(state[0], TIMESTAMP_FORMAT) - SYNC_OVERLAP
+        formula = (
+            'IS_AFTER(LAST_MODIFIED_TIME(), DATETIME_PARSE('
+            f'\'{since.strftime(TIMESTAMP_FORMAT)}\'))'
+        )
+        full_synced_at = state[1]
+    changed = {}
+    for single_record in iterate_records(
+            base_id, table_id, api_key, formula, api_url
+    ):
+        fields = single_record['fields']
+        if 'Tag' not in fields:
+            continue
+        changed[preprocess_tag(fields['Tag'])] = fields.get(
+            'Record_ID', single_record['id']
+        )
+    print_msg(
+        f'Tag index {"full" if full_sync else "incremental"} sync: '
+        f'{len(changed)} tags fetched.'
+    )
+    with templates_connection() as (_, cursor):
+        if full_sync:
+            index.clear()
+            cursor.execute(
+                'DELETE FROM templates.airtable_tags '
+                'WHERE base_id = %s AND table_id = %s',
+                (base_id, table_id)
+            )
+        __store_tags(cursor, base_id, table_id, index, changed)
+        bulk_insert_into_query(
+            cursor, 'airtable_tags_sync_state',
+            ('base_id', 'table_id', 'synced_at', 'full_synced_at'),
+            [(
+                base_id, table_id, started_at.strftime(TIMESTAMP_FORMAT),
+                full_synced_at
+            )],
+            'templates', replace_=True
+        )
+    __sync_states[key] = (
+        started_at.strftime(TIMESTAMP_FORMAT), full_synced_at
+    )
+    return index
+
+
+def clear_tag_indices():
+    """Drops the in-process cache, the tables are left as they are."""
+    __indices.clear()
+    __sync_states.clear()
+
+
+def __load_stored_tags(base_id, table_id, index, missing):
+    with templates_connection() as (_, cursor):
+        index.update(select_where_in_query(
+            cursor, 'tag, record_id', 'airtable_tags', 'tag', list(missing),
+            'templates', where_='base_id = %s AND table_id = %s',
+            params=(base_id, table_id)
+        ))
+
+
+def __create_missing_tags(base_id, table_id, api_key, api_url, index, missing):
+    print_msg(f'Creating {len(missing)} new tags in AirTable.')
+    result = create_records(
+        base_id, table_id,
+        [{'Tag': t, 'Status': 'Requested'} for t in missing.values()],
+        api_key, api_url=api_url
+    )
+    created = {}
+    for single_record in result.created:
+        fields = single_record['fields']
+        created[preprocess_tag(fields['Tag'])] = fields.get(
+            'Record_ID', single_record['id']
+        )
+    for single_record in result.failed:
+        print_msg(f'Failed to create tag: {single_record["Tag"]}', 2)
+    with templates_connection() as (_, cursor):
+        __store_tags(cursor, base_id, table_id, index, created)
+
+
+def __store_tags(cursor, base_id, table_id, index, tags):
+    index.update(tags)
+    bulk_insert_into_query(
+        cursor, 'airtable_tags', TAGS_COLUMNS,
+        [(base_id, table_id, k, v) for k, v in tags.items()],
+        'templates', replace_=True
+    )
@@ -0,0 +1,179 @@
+from decimal import Decimal
+import os
+import threading
+from time import monotonic
+
+import numpy as np
+
+from abbreviations import get_tag_translations
+from connections import superleague_connection
+
+SNAPSHOT_TTL_SECONDS = float(os.environ.get('SNAPSHOT_TTL_SECONDS', 900))
+# Snapshots kept at most, the oldest loaded is dropped first.
+SNAPSHOT_CACHE_SIZE = int(os.environ.get('SNAPSHOT_CACHE_SIZE', 16))
+INTEGER_TYPES = (int, np.integer)
+# DECIMAL columns come back from MySQL as Decimal.
+NUMERIC_TYPES = (int, float, Decimal, np.integer, np.floating)
+
+# name -> loader(cursor, team_id, cut_off_left, cut_off_right). A loader
+# returns either a plain object, stored as is, or a (column_names, rows)
+# pair, stored as a ColumnarTable. No per-team loader is registered here
+# yet: the superleague queries live in generate_industrial, whose
+# generators still run them themselves, so in production a snapshot only
+# carries the shared data below. The benchmarks register fixture loaders.
+SNAPSHOT_LOADERS = {}
+# name -> loader(cursor), returning the same kinds of values. Data that does
+# not depend on the team (leagues, seasons, finals, tag translations) is
+# loaded once and shared by the snapshots of every team.
+SHARED_LOADERS = {
+    'tag_translations': get_tag_translations,
+}
+
+__snapshots = {}
+__snapshots_lock = threading.Lock()
+__shared = None
+__shared_lock = threading.Lock()
+
+
+class ColumnarTable:
+    """Rows stored as one NumPy array per column.
+
+    Integer columns are int64, other numeric columns float64, and integer
+    columns with NULLs float64 with NaN in their place. Any other column is
+    integer-coded: `columns[name]` holds the codes, -1 for NULL, and
+    `vocabularies[name]` the distinct values they index.
+    """
+    __slots__ = ('names', 'columns', 'vocabularies', 'length')
+
+    def __init__(self, names, rows):
+        self.names = tuple(names)
+        self.columns = {}
+        self.vocabularies = {}
+        self.length = len(rows)
+        for i, name in enumerate(self.names):
+            values = [single_row[i] for single_row in rows]
+            present = [v for v in values if v is not None]
+            if all(isinstance(v, INTEGER_TYPES) for v in present) and (
+                    len(present) == len(values)
+            ):
+                self.columns[name] = np.asarray(values, dtype=np.int64)
+            elif all(isinstance(v, NUMERIC_TYPES) for v in present):
+                self.columns[name] = np.asarray(
+                    [np.nan if v is None else float(v) for v in values],
+                    dtype=np.float64
+                )
+            else:
+                codes = {
+                    v: code for code, v in enumerate(dict.fromkeys(present))
+                }
+                vocabulary = np.empty(len(codes), dtype=object)
+                vocabulary[:] = list(codes)
+                self.columns[name] = np.asarray(
+                    [-1 if v is None else codes[v] for v in values],
+                    dtype=np.int32
+                )
+                self.vocabularies[name] = vocabulary
+
+    def __len__(self):
+        return self.length
+
+    def values(self, name):
+        if name in self.vocabularies:
+            codes = self.columns[name]
+            values = self.vocabularies[name][codes]
+            values[codes < 0] = None
+            return values
+        return self.columns[name]
+
+
+class TeamSnapshot:
+    """Superleague data for one team and cut-off window."""
+    __slots__ = (
+        'team_id', 'cut_off_left', 'cut_off_right', 'data', 'loaded_at'
+    )
+
+    def __init__(self, team_id, cut_off_left, cut_off_right, data):
+        self.team_id = team_id
+        self.cut_off_left = cut_off_left
+        self.cut_off_right = cut_off_right
+        self.data = data
+        self.loaded_at = monotonic()
+
+    def __getattr__(self, name):
+        try:
+            return self.data[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def register_snapshot_loader(name):
+    def decorator(loader):
+        SNAPSHOT_LOADERS[name] = loader
+        return loader
+    return decorator
+
+
+def register_shared_loader(name):
+    def decorator(loader):
+        SHARED_LOADERS[name] = loader
+        return loader
+    return decorator
+
+
+def get_team_snapshot(
+        team_id, cut_off_left, cut_off_right, ttl=SNAPSHOT_TTL_SECONDS
+):
+    key = (team_id, cut_off_left, cut_off_right)
+    with __snapshots_lock:
+        snapshot = __snapshots.get(key)
+        if snapshot is not None and monotonic() - snapshot.loaded_at < ttl:
+            return snapshot
+    snapshot = load_team_snapshot(team_id, cut_off_left, cut_off_right)
+    with __snapshots_lock:
+        now = monotonic()
+        for single_key, single_snapshot in list(__snapshots.items()):
+            if now - single_snapshot.loaded_at >= ttl:
+                del __snapshots[single_key]
+        # Re-inserted, so the dict stays in load order.
+        __snapshots.pop(key, None)
+        __snapshots[key] = snapshot
+        while len(__snapshots) > SNAPSHOT_CACHE_SIZE:
+            __snapshots.pop(next(iter(__snapshots)))
+    return snapshot
+
+
+def load_team_snapshot(team_id, cut_off_left, cut_off_right):
+    with superleague_connection() as (_, cursor):
+        data = dict(get_shared_data(cursor))
+        for name, loader in SNAPSHOT_LOADERS.items():
+            data[name] = __as_snapshot_value(
+                loader(cursor, team_id, cut_off_left, cut_off_right)
+            )
+    return TeamSnapshot(team_id, cut_off_left, cut_off_right, data)
+
+
+def get_shared_data(cursor, ttl=SNAPSHOT_TTL_SECONDS):
+    global __shared
+    # Held while loading, so teams starting together wait for one load
+    # instead of each running the same queries.
+    with __shared_lock:
+        if __shared is None or monotonic() - __shared[0] >= ttl:
+            __shared = (monotonic(), {
+                name: __as_snapshot_value(loader(cursor))
+                for name, loader in SHARED_LOADERS.items()
+            })
+        return __shared[1]
+
+
+def clear_snapshot_cache():
+    global __shared
+    with __shared_lock:
+        __shared = None
+    with __snapshots_lock:
+        __snapshots.clear()
+
+
+def __as_snapshot_value(loaded):
+    if isinstance(loaded, tuple) and len(loaded) == 2:
+        return ColumnarTable(*loaded)
+    return loaded
@@ -0,0 +1,63 @@
+from functools import lru_cache
+import re
+import sys
+from unicodedata import normalize
+
+from constants import VOWELS
+
+# Questions keep mentioning the same few thousand players, teams, leagues
+# and tags, so every normalization is computed once per distinct input and
+# the result is interned.
+NORMALIZATION_CACHE_SIZE = 65536
+LEAGUE_ARTICLES = frozenset(('la', 'le'))
+CAPITALS_PAIR_PATTERN = re.compile(r'[A-Z]{2}')
+
+
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
+def preprocess_tag(tag):
+    tag = tag.lower().strip()
+    if not tag.isascii():
+        tag = normalize('NFKD', tag).encode('ascii', 'ignore').decode('ascii')
+    return sys.intern(tag)
+
+
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
+def preprocess_player_name(player_name):
+    # Every occurrence of a pair is replaced, not only the one that was
+    # matched, so this keeps the replace loop instead of a single re.sub.
+    for single_pair in dict.fromkeys(
+            CAPITALS_PAIR_PATTERN.findall(player_name)
+    ):
+        player_name = player_name.replace(
+            single_pair, f'{single_pair[0]}\'{single_pair[1]}'
+        )
+    return sys.intern(player_name)
+
+
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
+def format_player_tag(name, birth_date):
+    if birth_date is None:
+        return name
+    return sys.intern(f'{name}_{format_birth_date(birth_date)}')
+
+
+def format_birth_date(birth_date):
+    return birth_date.strftime('%d.%m.%Y')
+
+
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
+def is_vowel_start(s):
+    return s.lower()[:1] in VOWELS
+
+
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
+def is_league_with_article(league):
+    return not LEAGUE_ARTICLES.isdisjoint(league.lower().split(' '))
+
+
+def clear_normalization_caches():
+    for single_function in (
+            preprocess_tag, preprocess_player_name, format_player_tag,
+            is_vowel_start, is_league_with_article
+    ):
+        single_function.cache_clear()
@@ -1,11 +1,62 @@
+from functools import lru_cache
+from hashlib import sha1
+from itertools import islice
 from json import dump, loads
 import re
-
-import numpy as np
+import sys
+import threading
 
 from constants import (
-    EASY, MEDIUM, HARD, SPECIFIC_TO_MAIN_MAPPING, VOWELS,
+    EASY, MEDIUM, HARD, SPECIFIC_TO_MAIN_MAPPING,
+)
+from instrumentation import count
+# Re-exported, the generators import these from utils.
+from text_normalization import (  # noqa: F401
+    format_birth_date, format_player_tag, is_league_with_article,
+    is_vowel_start, preprocess_player_name
+)
+
+TEMPLATE_CACHE_SIZE = 1024
+STATEMENT_CACHE_SIZE = 256
+SEASON_CACHE_SIZE = 4096
+TEMPLATE_VARIABLES_ALIASES = {
+    '$LEAGUE': '$COMPETITION',
+    '$FROMTEAM': '$TEAM',
+    '$TOTEAM': '$TEAM',
+    '$WINNER': '$TEAM',
+    '$NOWINNER': '$TEAM',
+    '$AGAINSTTEAM': '$TEAM',
+    '$MNUMBER': '$NUMBER',
+    '$SNUMBER': '$NUMBER',
+}
+TEMPLATE_ALIASES_PATTERN = re.compile(
+    '|'.join(re.escape(alias) for alias in TEMPLATE_VARIABLES_ALIASES)
 )
+TEMPLATE_VARIABLE_PATTERN = re.compile(r'\$[A-Z]+')
+
+__rng_state = threading.local()
+
+
+# numpy is imported where it is used, so requests served from the existing
+# pool do not pay for it on a cold start.
+def get_rng():
+    import numpy as np
+    return getattr(__rng_state, 'rng', None) or np.random
+
+
+def seed_thread_rng(seed):
+    import numpy as np
+    if seed is None:
+        __rng_state.rng = None
+    else:
+        __rng_state.rng = np.random.RandomState(seed)
+
+
+def progress(iterable, **kwargs):
+    if not sys.stderr.isatty():
+        return iterable
+    from tqdm import tqdm
+    return tqdm(iterable, **kwargs)
 
 
 def print_msg(msg, stars_count=1):
@@ -14,7 +65,10 @@ def print_msg(msg, stars_count=1):
 
 def dump_dict_as_json(path_to_json, dict):
     with open(path_to_json, 'w', encoding='utf8') as f:
-        dump(dict, f, indent=2, ensure_ascii=False)
+        dump(
+            dict, f, indent=2, ensure_ascii=False,
+            default=lambda o: o.to_dict()
+        )
 
 
 def load_json_as_dict(path_to_json):
@@ -24,30 +78,150 @@ def load_json_as_dict(path_to_json):
     return json_as_dict
 
 
-def select_query(cursor, select_, from_, where_='', db_name='superleague'):
-    query = f'SELECT {select_} FROM {db_name}.{from_}'
-    if where_ != '':
-        query += f' WHERE {where_}'
-    cursor.execute(query)
+# Statements are built once per shape and returned as the same string
+# object afterwards. A prepared cursor only re-prepares when the statement
+# object changes, so this also lets it reuse the server-side statement.
+# Values always go through %s placeholders. mysql-connector substitutes
+# every %s of a statement executed with parameters and never unescapes %%,
+# so a literal % in where_ is fine as is, but a literal %s (e.g.
+# LIKE '%sevilla%') has to be passed as a parameter instead. update_query
+# always runs with parameters, and select_query does when limit_ is
+# given; without params both reject a where_ containing %s instead of
+# sending a shifted statement.
+def select_query(
+        cursor, select_, from_, where_='', db_name='superleague',
+        params=(), limit_=None, lock_=''
+):
+    query = __select_statement(
+        select_, from_, where_, db_name, limit_ is not None, lock_
+    )
+    if limit_ is not None:
+        __check_literal_placeholders(where_, params)
+        params = tuple(params) + (int(limit_),)
+    if len(params) > 0:
+        cursor.execute(query, tuple(params))
+    else:
+        cursor.execute(query)
     out = cursor.fetchall()
+    count('db_round_trips')
+    count('rows_fetched', len(out))
     return out
 
 
 def insert_into_query(cursor, into_, columns, values, db_name='superleague'):
-    query = f'INSERT INTO {db_name}.{into_} ({", ".join(columns)}) '
-    query += f'VALUES {values}'
-    cursor.execute(query)
+    cursor.execute(
+        __insert_statement(into_, tuple(columns), db_name), tuple(values)
+    )
+    count('db_round_trips')
+
+
+def bulk_insert_into_query(
+        cursor, into_, columns, rows, db_name='superleague', chunk_size=1000,
+        replace_=False
+):
+    query = __insert_statement(into_, tuple(columns), db_name, replace_)
+    for chunk in split_into_chunks(rows, chunk_size):
+        cursor.executemany(query, chunk)
+        count('db_round_trips')
+
+
+def split_into_chunks(items, chunk_size):
+    items = iter(items)
+    chunk = list(islice(items, chunk_size))
+    while len(chunk) > 0:
+        yield chunk
+        chunk = list(islice(items, chunk_size))
 
 
 def update_query(
-        cursor, table, columns, values, where_, db_name='superleague'
+        cursor, table, columns, values, where_, db_name='superleague',
+        params=()
 ):
-    query = f'UPDATE {db_name}.{table} '
-    query += 'SET ' + ', '.join(
-        f'{c} = {v.__repr__()}' for c, v in zip(columns, values)
+    __check_literal_placeholders(where_, params)
+    cursor.execute(
+        __update_statement(table, tuple(columns), where_, db_name),
+        tuple(values) + tuple(params)
     )
+    count('db_round_trips')
+
+
+def select_where_in_query(
+        cursor, select_, from_, key_column, keys,
+        db_name='superleague', chunk_size=1000, where_='', params=()
+):
+    out = []
+    for chunk in split_into_chunks(keys, chunk_size):
+        query = __where_in_statement(
+            f'SELECT {select_} FROM {db_name}.{from_}', key_column, len(chunk),
+            where_
+        )
+        cursor.execute(query, tuple(params) + tuple(chunk))
+        out += cursor.fetchall()
+        count('db_round_trips')
+    count('rows_fetched', len(out))
+    return out
+
+
+def update_where_in_query(
+        cursor, table, columns, values, key_column, keys,
+        db_name='superleague', chunk_size=1000, where_='', params=()
+):
+    set_ = ', '.join(f'{c} = %s' for c in columns)
+    for chunk in split_into_chunks(keys, chunk_size):
+        query = __where_in_statement(
+            f'UPDATE {db_name}.{table} SET {set_}', key_column, len(chunk),
+            where_
+        )
+        cursor.execute(query, tuple(values) + tuple(params) + tuple(chunk))
+        count('db_round_trips')
+
+
+def __check_literal_placeholders(where_, params):
+    if len(params) == 0 and '%s' in where_:
+        raise ValueError(
+            f'where_ contains a literal %s, pass it as a parameter: {where_}'
+        )
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def __select_statement(select_, from_, where_, db_name, limited, lock_):
+    query = f'SELECT {select_} FROM {db_name}.{from_}'
+    if where_ != '':
+        query += f' WHERE {where_}'
+    if limited:
+        query += ' LIMIT %s'
+    if lock_ != '':
+        query += f' {lock_}'
+    return query
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def __insert_statement(into_, columns, db_name, replace_=False):
+    query = f'{"REPLACE" if replace_ else "INSERT"} INTO '
+    query += f'{db_name}.{into_} ({", ".join(columns)}) '
+    query += f'VALUES ({", ".join(["%s"] * len(columns))})'
+    return query
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def __update_statement(table, columns, where_, db_name):
+    query = f'UPDATE {db_name}.{table} '
+    query += 'SET ' + ', '.join(f'{c} = %s' for c in columns)
     query += f' WHERE {where_}'
-    cursor.execute(query)
+    return query
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def __where_in_statement(prefix, key_column, keys_count, where_=''):
+    query = f'{prefix} WHERE '
+    if where_ != '':
+        query += f'{where_} AND '
+    query += f'{key_column} IN ({", ".join(["%s"] * keys_count)})'
+    return query
+
+
+def question_hash(question):
+    return sha1(question.encode('utf8')).hexdigest()
 
 
 def resolve_counts(count):
@@ -57,10 +231,8 @@ def resolve_counts(count):
 
 
 def make_questions_from_positive_and_negative(positive, negative):
-    questions = merge_dicts(
-        assign_answers_to_questions(positive, True),
-        assign_answers_to_questions(negative, False)
-    )
+    questions = assign_answers_to_questions(positive, True)
+    questions.update(assign_answers_to_questions(negative, False))
     return questions
 
 
@@ -76,49 +248,160 @@ def assign_answers_to_questions(questions, answer):
     return questions
 
 
-def generate_random_player_team_couples(input_team_id, count, assignment):
-    team_assignment = [
-        (player_id, team_id) for player_id, team_id in assignment
-        if team_id == input_team_id
-    ]
-    if len(team_assignment) > count:
-        couples_indices = np.random.choice(
-            list(range(len(team_assignment))), count, replace=False
+ASSIGNMENT_DTYPE = [('player_id', 'int64'), ('team_id', 'int64')]
+
+
+class AssignmentIndex:
+    """(player_id, team_id) couples sorted by team with per-team offsets.
+
+    Building it costs far more than one scan of the list, so it is meant
+    for assignments loaded once and shared, e.g. through a snapshot.
+    Couples with a NULL id are left out. The sort is stable, so each team
+    keeps the order of the source list.
+    """
+    __slots__ = ('couples', 'offsets')
+
+    def __init__(self, assignment):
+        import numpy as np
+        couples = np.array(
+            [
+                tuple(single_couple) for single_couple in assignment
+                if None not in single_couple
+            ],
+            dtype=ASSIGNMENT_DTYPE
         )
+        self.couples = couples[np.argsort(couples['team_id'], kind='stable')]
+        team_ids, starts, counts = np.unique(
+            self.couples['team_id'], return_index=True, return_counts=True
+        )
+        self.offsets = {
+            int(t): (int(s), int(s + c))
+            for t, s, c in zip(team_ids, starts, counts)
+        }
+
+    def team_couples(self, team_id):
+        start, end = self.offsets.get(team_id, (0, 0))
+        return self.couples[start:end]
+
+
+def generate_random_player_team_couples(input_team_id, count, assignment):
+    # A plain list is scanned, an AssignmentIndex sliced; both skip NULL
+    # players and keep the team's couples in order, so a seed picks the
+    # same ones.
+    if isinstance(assignment, AssignmentIndex):
+        team_couples = assignment.team_couples(input_team_id).tolist()
     else:
-        couples_indices = range(len(team_assignment))
-    couples = [team_assignment[i] for i in couples_indices]
-    return couples
+        team_couples = [
+            (player_id, team_id) for player_id, team_id in assignment
+            if team_id == input_team_id and player_id is not None
+        ]
+    if len(team_couples) > count:
+        couples_indices = get_rng().choice(
+            len(team_couples), count, replace=False
+        )
+        team_couples = [team_couples[i] for i in couples_indices]
+    return team_couples
+
+
+def sample_questions_inputs(input_team_id, count, assignment, templates):
+    couples = generate_random_player_team_couples(
+        input_team_id, count, assignment
+    )
+    chosen_templates = choose_random_templates(templates, len(couples))
+    difficulties = generate_random_difficulties(len(couples))
+    return couples, chosen_templates, difficulties
 
 
 def append_question(
         questions, single_question, tags, parent_tags, difficulty, template
 ):
-    std_template = template.replace('$LEAGUE', '$COMPETITION')
-    std_template = std_template.replace('$FROMTEAM', '$TEAM')
-    std_template = std_template.replace('$TOTEAM', '$TEAM')
-    std_template = std_template.replace('$WINNER', '$TEAM')
-    std_template = std_template.replace('$NOWINNER', '$TEAM')
-    std_template = std_template.replace('$AGAINSTTEAM', '$TEAM')
-    std_template = std_template.replace('$MNUMBER', '$NUMBER')
-    std_template = std_template.replace('$SNUMBER', '$NUMBER')
+    # Generators keep working on plain dicts; QuestionSink turns them into
+    # Question records once a generator is done.
     questions[single_question] = {
         'tags': tags,
         'parent_tags': parent_tags,
         'difficulty': difficulty,
-        'template': std_template,
+        'template': compile_template(template).normalized,
     }
 
 
+class CompiledTemplate:
+    """Template analysed once: normalized text, variables and `$` count.
+
+    `template` is either a string or a dict of (nested) templates; for a
+    dict `normalized` is None and `var_count` is the max over its values.
+    """
+    __slots__ = ('normalized', 'variables', 'var_count', 'texts')
+
+    def __init__(self, normalized, variables, var_count, texts):
+        self.normalized = normalized
+        self.variables = variables
+        self.var_count = var_count
+        self.texts = texts
+
+    def has_variable(self, variable):
+        return any(variable in single_text for single_text in self.texts)
+
+
+__compiled_dicts = {}
+__compiled_dicts_lock = threading.Lock()
+
+
+def compile_template(template):
+    """Accepts a string, a dict of templates or an already compiled one."""
+    if isinstance(template, CompiledTemplate):
+        return template
+    if isinstance(template, str):
+        return __compile_template_key(template)
+    # Dicts are unhashable, so they are memoized by identity, holding a
+    # reference so the id cannot be reused by another dict.
+    key = id(template)
+    with __compiled_dicts_lock:
+        cached = __compiled_dicts.get(key)
+        if cached is not None and cached[0] is template and (
+                cached[1] == len(template)
+        ):
+            return cached[2]
+    compiled = __compile_template_key(__get_template_key(template))
+    with __compiled_dicts_lock:
+        if len(__compiled_dicts) >= TEMPLATE_CACHE_SIZE:
+            __compiled_dicts.pop(next(iter(__compiled_dicts)))
+        __compiled_dicts[key] = (template, len(template), compiled)
+    return compiled
+
+
+def __get_template_key(template):
+    if isinstance(template, str):
+        return template
+    return tuple(__get_template_key(t) for t in template.values())
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def __compile_template_key(template_key):
+    if isinstance(template_key, str):
+        return CompiledTemplate(
+            TEMPLATE_ALIASES_PATTERN.sub(
+                lambda m: TEMPLATE_VARIABLES_ALIASES[m.group(0)], template_key
+            ),
+            frozenset(TEMPLATE_VARIABLE_PATTERN.findall(template_key)),
+            template_key.count('$'),
+            (template_key,),
+        )
+    compiled = [__compile_template_key(t) for t in template_key]
+    return CompiledTemplate(
+        None,
+        frozenset().union(*(c.variables for c in compiled)),
+        max(c.var_count for c in compiled),
+        tuple(t for c in compiled for t in c.texts),
+    )
+
+
 def all_lists_are_not_empty(lists):
     return all(len(single_list) > 0 for single_list in lists)
 
 
 def get_var_count(template):
-    if isinstance(template, str):
-        return template.count('$')
-    else:
-        return max(get_var_count(sub_t) for sub_t in template.values())
+    return compile_template(template).var_count
 
 
 def resolve_position(actual_position):
@@ -129,7 +412,7 @@ def resolve_position(actual_position):
 
 def choose_random_templates(templates, count):
     if len(templates) > 0:
-        return list(np.random.choice(templates, count))
+        return list(get_rng().choice(templates, count))
     else:
         return []
 
@@ -143,30 +426,44 @@ def cut_off_and_season_name_do_not_match(
 
 
 def is_cut_off_and_season_name_match(cut_off_left, cut_off_right, season_name):
-    season_first_year = int(season_name.split('-')[0])
+    season_first_year = get_first_year_from_season_name(season_name)
     return cut_off_left <= season_first_year <= cut_off_right
 
 
-def is_vowel_start(s):
-    return any(s.lower().startswith(v) for v in VOWELS)
+# Superleague rows repeat a few dozen season names, so the helpers below
+# parse each name once and work on whole columns of first years.
+def season_first_years(season_names):
+    import numpy as np
+    return np.fromiter(
+        map(get_first_year_from_season_name, season_names), dtype=np.int64,
+        count=len(season_names)
+    )
 
 
-def is_league_with_article(league):
-    articles = ('la', 'le',)
-    return any(a in league.lower().split(' ') for a in articles)
+def cut_off_mask(first_years, cut_off_left, cut_off_right):
+    return (first_years >= cut_off_left) & (first_years <= cut_off_right)
+
+
+def filter_rows_by_cut_off(rows, season_column, cut_off_left, cut_off_right):
+    first_years = season_first_years(
+        [single_row[season_column] for single_row in rows]
+    )
+    mask = cut_off_mask(first_years, cut_off_left, cut_off_right)
+    return [single_row for single_row, keep in zip(rows, mask) if keep]
 
 
 def assess_difficulty(template, season='', position=''):
-    if get_var_count(template) > 3:
+    var_count = get_var_count(template)
+    if var_count > 3:
         if season != '':
-            year = int(season.split('-')[0])
+            year = get_first_year_from_season_name(season)
             if year < 2010:
                 return HARD
         else:
             return HARD
-    elif get_var_count(template) <= 2:
+    elif var_count <= 2:
         if season != '':
-            year = int(season.split('-')[0])
+            year = get_first_year_from_season_name(season)
             if year >= 2015:
                 return EASY
         else:
@@ -174,10 +471,34 @@ def assess_difficulty(template, season='', position=''):
     return MEDIUM
 
 
+def assess_difficulties(templates, seasons=None):
+    import numpy as np
+    var_counts = np.fromiter(
+        map(get_var_count, templates), dtype=np.int64, count=len(templates)
+    )
+    if seasons is None:
+        seasons = [''] * len(templates)
+    has_season = np.fromiter(
+        (season != '' for season in seasons), dtype=bool, count=len(seasons)
+    )
+    years = season_first_years(
+        [season if season != '' else '0' for season in seasons]
+    )
+    difficulties = np.full(len(templates), MEDIUM, dtype=object)
+    difficulties[(var_counts > 3) & (~has_season | (years < 2010))] = HARD
+    difficulties[(var_counts <= 2) & (~has_season | (years >= 2015))] = EASY
+    return difficulties.tolist()
+
+
 def generate_random_difficulty():
-    return np.random.choice([EASY, MEDIUM, HARD])
+    return get_rng().choice([EASY, MEDIUM, HARD])
+
 
+def generate_random_difficulties(count):
+    return list(get_rng().choice([EASY, MEDIUM, HARD], count))
 
+
+@lru_cache(maxsize=SEASON_CACHE_SIZE)
 def shorten_season(season):
     if '-' in season:
         first_year = season.split('-')[0]
@@ -188,14 +509,10 @@ def shorten_season(season):
 
 
 def is_variable_in_template(template, variable):
-    if isinstance(template, str):
-        return variable in template
-    else:
-        return any(
-            is_variable_in_template(t, variable) for t in template.values()
-        )
+    return compile_template(template).has_variable(variable)
 
 
+@lru_cache(maxsize=SEASON_CACHE_SIZE)
 def get_first_year_from_season_name(season_name):
     if '-' in season_name:
         year = season_name.split('-')[0]
@@ -205,28 +522,6 @@ def get_first_year_from_season_name(season_name):
     return year
 
 
-def format_player_tag(name, birth_date):
-    if birth_date is None:
-        return name
-    return f'{name}_{format_birth_date(birth_date)}'
-
-
-def format_birth_date(birth_date):
-    return birth_date.strftime('%d.%m.%Y')
-
-
-def preprocess_player_name(player_name):
-    no_ap = re.findall(r'[A-Z]{2}', player_name)
-    for single_no_ap in no_ap:
-        if len(single_no_ap) != 2:
-            continue
-        first_ch, second_ch = single_no_ap
-        player_name = player_name.replace(
-            single_no_ap, f'{first_ch}\'{second_ch}'
-        )
-    return player_name
-
-
 def strip_if_not_none(str_):
     if str_ is None:
         return None